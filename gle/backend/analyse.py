@@ -1,5 +1,6 @@
 import reader as r
 import utils as u
+import spectral as s
 import pandas as pd
 from matplotlib import pyplot as plt
 from scipy.signal import find_peaks
@@ -12,33 +13,14 @@ This module contains functions to analyse the data from the input file."""
 
 async def get_natural_freqs(data: pd.DataFrame, options: dict) -> None:
     accelerometers = options['accelerometers']
-    sample_rate = options['samplingFreq']
-
-    freqs = []
-    frf = []
-    frf_abs = []
-
-    for acc in accelerometers.keys():
-        if accelerometers[acc]:
-            # Compute FFT and Frequency Response Function
-            n = len(data[acc])
-            sample_rate = 1 / (data['t'][1] - data['t'][0])
-            f = np.fft.fftfreq(n, 1/sample_rate)[:n//2]  # Positive frequencies
-            fftacc = np.fft.fft(data[acc])[:n//2]
-            fftforce = np.fft.fft(data['F' + acc[1]])[:n//2]
-
-            # Avoid division by zero
-            fftforce[np.abs(fftforce) < 1e-10] = np.finfo(float).eps
-            frf_a = fftacc / fftforce  # Frequency Response Function
-            frf_magnitude = np.abs(frf_a)
-
-            freqs.append(f)
-            frf.append(frf_a)
-            frf_abs.append(frf_magnitude)
-
-    freqs = np.array(freqs)
-    frf = np.array(frf)
-    frf_abs = np.array(frf_abs)
+    sample_rate = 1 / (data['t'].iloc[1] - data['t'].iloc[0])
+
+    spectrum = s.get_spectrum(data, options, sample_rate)
+    rows = s.channel_rows(accelerometers)
+
+    frf = spectrum['inertance'][rows]  # Frequency Response Functions
+    frf_abs = np.abs(frf)
+    freqs = np.broadcast_to(spectrum['f'], frf_abs.shape)  # Frequency axis of each row (without copying)
 
     #parameter for find peak
     prominence = 3
@@ -75,40 +57,13 @@ async def get_natural_freqs(data: pd.DataFrame, options: dict) -> None:
 
 async def get_mode_shapes(data: pd.DataFrame, options: dict) -> None:
     accelerometers = options['accelerometers']
-    sample_rate = options['samplingFreq']
-
-    freqs = []
-    i_frf = []
-    frf_abs = []
-
-    for acc in accelerometers.keys():
-        if accelerometers[acc]:
-            # Compute FFT and Frequency Response Function
-            n = len(data[acc])
-            sample_rate = 1 / (data['t'][1] - data['t'][0])
-            f = np.fft.fftfreq(n, 1/sample_rate)[:n//2]  # Positive frequencies
-            fftacc = np.fft.fft(data[acc])[:n//2]
-            fftforce = np.fft.fft(data['F' + acc[1]])[:n//2]
-
-            # Avoid division by zero
-            fftforce[np.abs(fftforce) < 1e-10] = np.finfo(float).eps
-            frf_a = fftacc / fftforce  # Frequency Response Function
-
-            # Convert inertance to receptance
-            omega = 2 * np.pi * f  # Convert frequency to angular frequency (rad/s)
-            omega[np.abs(omega) < 1e-10] = np.finfo(float).eps
-            frf_receptance = frf_a / (-omega**2)  # Convert inertance to receptance
-
-            frf_magnitude = np.abs(frf_a)
-            frf_img = np.imag(frf_receptance)
-
-            freqs.append(f)
-            i_frf.append(frf_img)
-            frf_abs.append(frf_magnitude)
-
-    freqs = np.array(freqs)
-    i_frf = np.array(i_frf)
-    frf_abs = np.array(frf_abs)
+    sample_rate = 1 / (data['t'].iloc[1] - data['t'].iloc[0])
+
+    spectrum = s.get_spectrum(data, options, sample_rate)
+    rows = s.channel_rows(accelerometers)
+
+    frf_abs = np.abs(spectrum['inertance'][rows])  # Magnitude of the Frequency Response Functions
+    i_frf = np.imag(spectrum['receptance'][rows])  # Imaginary part of the receptance
 
     #parameter for find peak
     prominence = 3
@@ -1,36 +1,48 @@
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+from PIL import Image
+import subprocess
+import tempfile
+import asyncio
+import os
+import numpy as np
 import pandas as pd
-import math
-from utils import accel_to_disp, format_accel_plot_name
+import figures as fg
+import reader as r
+import render as rd
+from utils import accel_to_disp, format_plot_name, output_settings
 
 
-plt.rcParams.update({
-    'font.size': 18,
-    'figure.figsize': (8, 5),
-    'figure.dpi': 300
-})
+L = 0.65/4  # Length of entire beam divided into 4 sections
 
+# Number of colours in each frame of a GIF
+GIF_COLORS = 32
 
-fig, ax = plt.subplots()
-fig.tight_layout(pad=3)
-line, = ax.plot([], [])
+# Minimum number of frames each worker must draw for an animation to be split across workers
+FRAMES_PER_WORKER = int(os.environ.get('ANIMATION_FRAMES_PER_WORKER', 60))
 
 
-def init():
+def build_animation(shaker_position: int, dpi: int) -> dict:
 
-    line.set_data([], [])
+    """
+    Build the figure of a beam animation for one request.
 
-    return line,
+    The title, labels and limits are drawn once into a background. Only the beam, the shaker marker and the timer
+    are redrawn for each frame.
 
+    Parameters
+    ----------
+    shaker_position : int
+        Index of the accelerometer at the shaker, which is highlighted in red.
+    dpi : int
+        Resolution of the frames.
 
-def animate(i: int, u: pd.DataFrame, step: int, shaker_position: int):
+    Returns
+    -------
+    dict
+        Dictionary containing the figure, its axes and the artists that change from frame to frame.
+    """
 
-    """Animator."""
-
-    L = 0.65/4  # Length of entire beam divided into 4 sections
-
-    ax.clear()
+    fig, ax = fg.new_figure(dpi=dpi)
+    fig.tight_layout(pad=3)
 
     ax.set_xlim(0-L, L*5)
     ax.set_ylim(-0.1, 0.1)
@@ -39,35 +51,79 @@ def animate(i: int, u: pd.DataFrame, step: int, shaker_position: int):
     ax.set_xlabel('Position [m]')
     ax.set_ylabel('Displacement [m]')
 
-    step_no = i*step
-    y = [u[j][step_no] for j in u.columns[1:]]
-    # y = [0, u['u_1'][step_no], u['u_2'][step_no], u['u_3'][step_no], u['u_4'][step_no]]
-
     # If we assume that the columns on each storey remain a constant length then z = sqrt((j*L)^2-x^2)
-    # z = [0]
-    # z.extend([math.sqrt((L*j)**2-(u[f'u_{j}'][i])**2) for j in range(1, num_accels)])
-
     # However, if columns remain a constant length, then they have infinite stiffness which is impossible in reality
     z = [i*L for i in range(5)]
 
-    ax.plot(z, y, marker='o', color='k')
+    beam, = ax.plot(z, np.zeros(5), marker='o', color='k', animated=True)
 
     # Plot shaker position in red
-    shaker_y = u[f'A{shaker_position}'][step_no]
-    shaker_z = L*shaker_position
-    ax.plot(shaker_z, shaker_y, marker='o', color='r')
+    shaker, = ax.plot([L*shaker_position], [0], marker='o', color='r', animated=True)
 
     # Add timer text in the corner
-    ax.text(0.70, 0.90, 'Time: {:.2f} s'.format(u['t'][step_no]), transform=ax.transAxes, fontsize=18)
+    timer = ax.text(0.70, 0.90, '', transform=ax.transAxes, fontsize=18, animated=True)
 
-    return line,
+    return {
+        'figure': fig,
+        'axes': ax,
+        'beam': beam,
+        'shaker': shaker,
+        'timer': timer,
+        'shakerPosition': shaker_position,
+    }
 
 
-async def animate_beam(data: pd.DataFrame, options: dict):
+def render_frames(animation: dict, u: pd.DataFrame, steps: list) -> list:
 
-    """Animate beam using displacement data."""
+    """
+    Render frames of a beam animation by blitting the changing artists over a cached background.
+
+    Parameters
+    ----------
+    animation : dict
+        Figure and artists returned by build_animation.
+    u : pd.DataFrame
+        DataFrame containing the displacement of each accelerometer and corresponding time data.
+    steps : list
+        Row of the displacement data shown in each frame.
+
+    Returns
+    -------
+    list
+        One RGBA image per frame.
+    """
+
+    fig = animation['figure']
+    ax = animation['axes']
+    canvas = fig.canvas
+
+    # Draw everything that does not move once
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+
+    displacements = u[u.columns[1:]].to_numpy()
+    shaker_column = u.columns.get_loc(f"A{animation['shakerPosition']}") - 1
+    t = u['t'].to_numpy()
+
+    frames = []
+    for step_no in steps:
+        canvas.restore_region(background)
+
+        animation['beam'].set_ydata(displacements[step_no])
+        animation['shaker'].set_ydata([displacements[step_no, shaker_column]])
+        animation['timer'].set_text('Time: {:.2f} s'.format(t[step_no]))
+
+        for artist in (animation['beam'], animation['shaker'], animation['timer']):
+            ax.draw_artist(artist)
+
+        frames.append(Image.frombuffer('RGBA', canvas.get_width_height(), bytes(canvas.buffer_rgba()), 'raw', 'RGBA', 0, 1))
+
+    return frames
+
+
+def frame_steps(data: pd.DataFrame) -> tuple:
 
-    data = accel_to_disp(data, options)
+    """Return the row shown in each frame of an animation and its frame rate."""
 
     # Plot at every nth interval
     n = len(data)//15
@@ -79,22 +135,172 @@ async def animate_beam(data: pd.DataFrame, options: dict):
 
     # print('Target animation duration: ', frames/true_fps, 's')
 
-    ani = animation.FuncAnimation(fig, animate, fargs=(data, n, options['shakerPosition']), frames=frames, init_func=init)
-        
-    plot_path = f'./images/{format_accel_plot_name(options, 'anim')}'.replace('.png', '.gif')
-    
-    ani.save(plot_path, writer='pillow', fps=true_fps)
+    return [i*n for i in range(frames)], true_fps
+
+
+def prepare_frame(image: Image.Image, animation_format: str) -> Image.Image:
+
+    """Convert a rendered frame to what the encoder expects (GIF frames are reduced to a small palette)."""
+
+    image = image.convert('RGB')
+
+    if animation_format == 'gif':
+        # The plot only has a few colours, so a fast palette is enough and saves the encoder from building one
+        return image.quantize(colors=GIF_COLORS, method=Image.Quantize.FASTOCTREE)
+
+    return image
+
+
+def render_chunk(data: pd.DataFrame, options: dict, start: int, stop: int) -> list:
+
+    """
+    Render a range of frames of a beam animation, ready to be encoded. This runs inside a worker process.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the acceleration data and corresponding time data.
+    options : dict
+        Dictionary of options sent with the request.
+    start, stop : int
+        Range of frames to render.
+
+    Returns
+    -------
+    list
+        The frames as PIL images.
+    """
+
+    disp, _ = accel_to_disp(data, options)
+    steps, _ = frame_steps(disp)
+    settings = output_settings(options, 'anim')
+
+    with fg.styled():
+        animation = build_animation(options['shakerPosition'], settings['dpi'])
+        images = render_frames(animation, disp, steps[start:stop])
+
+    return [prepare_frame(image, settings['format']) for image in images]
+
+
+def encode(images: list, plot_path: str, animation_format: str, fps: int):
+
+    """Write frames to an animated GIF or WebP with Pillow, or to an MP4 with ffmpeg."""
+
+    if animation_format == 'mp4':
+        width, height = images[0].size
+        command = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+            plot_path,
+        ]
+        subprocess.run(command, input=b''.join(image.tobytes() for image in images), check=True)
+    elif animation_format == 'webp':
+        images[0].save(plot_path, save_all=True, append_images=images[1:], duration=int(1000/fps), loop=0, quality=80)
+    else:
+        images[0].save(plot_path, save_all=True, append_images=images[1:], duration=int(1000/fps), loop=0)
+
+
+async def animate_beam(data: pd.DataFrame, options: dict):
+
+    """Animate beam using displacement data."""
+
+    steps, fps = frame_steps(data)
+    images = render_chunk(data, options, 0, len(steps))
+
+    plot_path = f'./images/{format_plot_name(options, 'anim')}'
+    encode(images, plot_path, output_settings(options, 'anim')['format'], fps)
+
+    return plot_path
+
+
+def render_segment(data: pd.DataFrame, options: dict, start: int, stop: int, segment_path: str) -> str:
+
+    """Render a range of frames of a beam animation and encode them to a segment file. This runs inside a worker process."""
+
+    _, fps = frame_steps(data)
+    encode(render_chunk(data, options, start, stop), segment_path, output_settings(options, 'anim')['format'], fps)
+
+    return segment_path
+
+
+def join_segments(segment_paths: list, plot_path: str):
+
+    """Join MP4 segments into one animation without encoding them again."""
+
+    list_path = os.path.join(os.path.dirname(segment_paths[0]), 'segments.txt')
+    with open(list_path, 'w') as f:
+        f.writelines(f"file '{os.path.abspath(path)}'\n" for path in segment_paths)
+
+    command = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', '-movflags', '+faststart',
+        plot_path,
+    ]
+    subprocess.run(command, check=True)
+
+
+def segment_count(frames: int, animation_format: str) -> int:
+
+    """Return how many workers an animation is worth splitting across (1 renders and encodes it in a single worker)."""
+
+    # GIF and WebP segments cannot be joined without encoding every frame again, which is the most expensive step
+    if animation_format != 'mp4':
+        return 1
+
+    # Each worker repeats the integration and the figure build, so it needs enough frames to make up for it
+    return max(1, min(rd.WORKERS, os.cpu_count() or 1, frames // FRAMES_PER_WORKER))
+
+
+async def render_parallel(func, options: dict):
+
+    """
+    Animate beam in a single worker, or split it across the render workers if it is long enough to be worth it.
+
+    The frames never leave the workers: either one worker renders and encodes the whole animation, or each worker
+    encodes a contiguous range of frames to an MP4 segment and the segments are joined without encoding them again.
+
+    Parameters
+    ----------
+    func : callable
+        Function that renders and encodes a whole animation (animate_beam).
+    options : dict
+        Dictionary of options sent with the request.
+
+    Returns
+    -------
+    str
+        The file path of the animation.
+    """
+
+    # Only the frame count is needed here, but reading the recording would still block the event loop
+    data = await asyncio.to_thread(r.read_csv, options)
+    steps, _ = frame_steps(data)
+
+    animation_format = output_settings(options, 'anim')['format']
+    parts = segment_count(len(steps), animation_format)
+    if parts == 1:
+        return await rd.render(func, options)
+
+    plot_path = f'./images/{format_plot_name(options, 'anim')}'
+
+    # Contiguous ranges of frames, one per worker
+    bounds = np.linspace(0, len(steps), parts + 1).astype(int)
+    with tempfile.TemporaryDirectory() as folder:
+        segment_paths = await asyncio.gather(*(
+            rd.render(render_segment, options, int(start), int(stop), os.path.join(folder, f'{index}.{animation_format}'))
+            for index, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]))
+        ))
+        await asyncio.to_thread(join_segments, segment_paths, plot_path)
 
     return plot_path
 
 
 if __name__ == '__main__':
     import json
-    import asyncio
-    import reader as r
     with open('./templates/requestFormat.json') as f:
         options = json.load(f)
     data = r.read_csv(options)
     plot_path = asyncio.run(animate_beam(data, options))
     # data = accel_to_disp(data, options)
-    # print(data)
\ No newline at end of file
+    # print(data)
@@ -1,22 +1,44 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 import uvicorn
 from dotenv import load_dotenv
+import asyncio
 import os
 import json
 import filter as f
 import reader as r
 import plotter as p
 import animate as a
+import render as rd
+import artifacts as ar
+import series as sr
+import modal as m
+import warmup as w
 import utils as u
 
 
 # Define root URL
 root_url = os.environ.get('PUBLIC_BACKEND_URL')
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Render common plots in the background at startup and whenever the data changes
+    warmup_task = None
+    if os.environ.get('WARMUP', '1') != '0':
+        warmup_task = asyncio.create_task(w.watch(serve_plot, ar.remove_dataset, rd.WORKERS))
+
+    yield
+
+    if warmup_task is not None:
+        warmup_task.cancel()
+    rd.shutdown()  # Stop the render workers when the API stops
+
+
 # Initialise API
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Allow cross-origin requests from frontend
 app.add_middleware(
@@ -31,6 +53,48 @@ app.add_middleware(
 app.mount("/images", StaticFiles(directory="images"), name="images")
 
 
+async def serve_plot(options: dict, file_ext: str, func, renderer=None) -> str:
+
+    """Return the path to a plot, rendering it only if it is not already in the image cache."""
+
+    filename = u.format_plot_name(options, file_ext)
+
+    if ar.lookup(filename):
+        return f'./images/{filename}'
+
+    with ar.pin(filename):
+        result = await rd.render_once(filename, func, options, renderer=renderer)
+
+        # Some plotting functions also return the values they computed
+        plot_path = result[0] if isinstance(result, tuple) else result
+        ar.add(os.path.basename(plot_path))
+
+    return plot_path
+
+
+def read_and_build(build, options: dict, *args):
+
+    """Read the requested dataset and build a result from it (run in a thread so that the event loop is not blocked)."""
+
+    return build(r.read_csv(options), options, *args)
+
+
+def series_response(series: dict, options: dict, details: str, encoding: str = 'json'):
+
+    """Return plot data as JSON or, if requested with encoding 'float32', as a compact binary payload."""
+
+    if options.get('encoding', encoding) == 'float32':
+        return Response(content=sr.to_float32(series), media_type='application/octet-stream')
+
+    return {
+        "details": details,
+        "message": sr.to_json(series),
+        "success": True,
+        "error": False,
+        "code": 200
+    }
+
+
 @app.get("/")
 async def root():
     return {
@@ -45,10 +109,11 @@ async def root():
 @app.post("/run-test")
 async def run_test(request: Request):
     options = await request.json()
-    data = r.read_csv(options)
-    p.plot_acceleration(data, options)
-    p.plot_forcing(data, options)
-    a.animate_beam(u.accel_to_disp(data, options), options)
+    await asyncio.gather(
+        serve_plot(options, 'accel', p.plot_acceleration),
+        serve_plot(options, 'force', p.plot_forcing),
+        serve_plot(options, 'anim', a.animate_beam, a.render_parallel),
+    )
 
     return {
         "details": "This endpoint generates all required plots based on user input during Test Setup.",
@@ -64,11 +129,7 @@ async def time_domain(request: Request):
     options = await request.json()
     file_ext = 'accel'
 
-    if u.check_if_file_exists(options, file_ext) is False:
-        data = r.read_csv(options)
-        plot_path = await p.plot_acceleration(data, options)
-    else:
-        plot_path = f'./images/{u.format_accel_plot_name(options, file_ext)}' 
+    plot_path = await serve_plot(options, file_ext, p.plot_acceleration)
 
     return {
         "details": "This should return either a graph of acceleration data.",
@@ -84,11 +145,7 @@ async def forcing(request: Request):
     options = await request.json()
     file_ext = 'force'
 
-    if u.check_if_file_exists(options, file_ext) is False:
-        data = r.read_csv(options)
-        plot_path = await p.plot_forcing(data, options)
-    else:
-        plot_path = f'./images/{u.format_filename(options)}_{file_ext}.png'
+    plot_path = await serve_plot(options, file_ext, p.plot_forcing)
 
     return {
         "details": "This gives the path to a forcing signal plot.",
@@ -104,11 +161,7 @@ async def animate(request: Request):
     options = await request.json()
     file_ext = 'anim'
 
-    if u.check_if_file_exists(options, file_ext) is False:
-        data = r.read_csv(options)
-        plot_path = await a.animate_beam(data, options)
-    else:
-        plot_path = f'./images/{u.format_accel_plot_name(options, file_ext)}'
+    plot_path = await serve_plot(options, file_ext, a.animate_beam, a.render_parallel)
 
     return {
         "details": "This should the path to a forcing signal gif/plot.",
@@ -124,11 +177,7 @@ async def dft(request: Request):
     options = await request.json()
     file_ext = 'dft'
 
-    if u.check_if_file_exists(options, file_ext) is False:
-        data = r.read_csv(options)
-        plot_path = await p.plot_dft(data, options)
-    else:
-        plot_path = f'./images/{u.format_accel_plot_name(options, file_ext)}' 
+    plot_path = await serve_plot(options, file_ext, p.plot_dft)
 
     return {
         "details": "This should return the path to the DFT plot.",
@@ -144,11 +193,7 @@ async def bode(request: Request):
     options = await request.json()
     file_ext = 'bode'
 
-    if u.check_if_file_exists(options, file_ext) is False:
-        data = r.read_csv(options)
-        plot_path = await p.plot_bode(data, options)
-    else:
-        plot_path = f'./images/{u.format_accel_plot_name(options, file_ext)}' 
+    plot_path = await serve_plot(options, file_ext, p.plot_bode)
 
     return {
         "details": "This should return the path to the Bode plot.",
@@ -164,11 +209,7 @@ async def nyquist(request: Request):
     options = await request.json()
     file_ext = 'nyquist'
 
-    if u.check_if_file_exists(options, file_ext) is False:
-        data = r.read_csv(options)
-        plot_path = await p.plot_nyquist(data, options)
-    else:
-        plot_path = f'./images/{u.format_accel_plot_name(options, file_ext)}' 
+    plot_path = await serve_plot(options, file_ext, p.plot_nyquist)
 
     return {
         "details": "This should return the path to the Nyquist plot.",
@@ -184,11 +225,7 @@ async def mode_shapes(request: Request):
     options = await request.json()
     file_ext = 'mode-shapes'
 
-    if u.check_if_file_exists(options, file_ext) is False:
-        data = r.read_csv(options)
-        plot_path = await p.plot_imaginary_r(data, options)
-    else:
-        plot_path = f'./images/{u.format_accel_plot_name(options, file_ext)}' 
+    plot_path = await serve_plot(options, file_ext, p.plot_imaginary_r)
 
     return {
         "details": "This should return the path to the mode shapes plot.",
@@ -199,6 +236,53 @@ async def mode_shapes(request: Request):
     }
 
 
+@app.post('/time-domain-data')
+async def time_domain_data(request: Request):
+    options = await request.json()
+    series = await asyncio.to_thread(read_and_build, sr.time_domain, options)
+
+    return series_response(series, options, "This returns the acceleration time series for the frontend to plot.")
+
+
+@app.post('/dft-data')
+async def dft_data(request: Request):
+    options = await request.json()
+    series = await asyncio.to_thread(read_and_build, sr.dft, options)
+
+    return series_response(series, options, "This returns the DFT amplitude spectra for the frontend to plot.")
+
+
+@app.post('/bode-data')
+async def bode_data(request: Request):
+    options = await request.json()
+    series = await asyncio.to_thread(read_and_build, sr.bode, options)
+
+    return series_response(series, options, "This returns the FRF gain and phase for the frontend to plot.")
+
+
+@app.post('/animate-data')
+async def animate_data(request: Request):
+    options = await request.json()
+    series = await asyncio.to_thread(read_and_build, sr.displacement, options)
+
+    # The displacements are sent as float32 unless JSON is requested
+    return series_response(series, options, "This returns the nodal displacements for the frontend to animate.", 'float32')
+
+
+@app.post('/modal-parameters')
+async def modal_parameters(request: Request):
+    options = await request.json()
+    results = await asyncio.to_thread(read_and_build, m.get_modal_parameters, options)
+
+    return {
+        "details": "This returns the natural frequencies, damping ratios and mode shapes found within the requested band.",
+        "message": results,
+        "success": True,
+        "error": False,
+        "code": 200
+    }
+
+
 # @app.get('/raw-data')
 # async def raw_data():
 #     return {"message": "This should return raw data."}
@@ -224,6 +308,28 @@ async def mode_shapes(request: Request):
 #     }
 
 
+@app.get('/cache-stats')
+async def cache_stats():
+    return {
+        "details": "This returns the hit/miss counters and size of the image cache.",
+        "message": ar.get_stats(),
+        "success": True,
+        "error": False,
+        "code": 200
+    }
+
+
+@app.get('/warmup-status')
+async def warmup_status():
+    return {
+        "details": "This returns the progress of rendering common plots ahead of time.",
+        "message": w.progress,
+        "success": True,
+        "error": False,
+        "code": 200
+    }
+
+
 @app.post('/start-tracking')
 async def start_tracking(request: Request):
     options = await request.json()
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import time
+import os
+
+"""
+This module manages the plots saved in the images folder. It keeps popular plots on disk and evicts the least
+recently used ones when the folder grows beyond its size budget."""
+
+
+IMAGE_DIR = './images'
+
+# Maximum number of bytes of plots kept on disk
+BUDGET_BYTES = int(os.environ.get('IMAGE_CACHE_BYTES', 512 * 1024**2))
+
+# Plots older than this many seconds are regenerated (0 disables expiry)
+TTL = float(os.environ.get('IMAGE_CACHE_TTL', 24 * 60 * 60))
+
+# Plots used within this many seconds are never evicted so that clients can still fetch them
+GRACE = float(os.environ.get('IMAGE_CACHE_GRACE', 60))
+
+_index = None  # Filename -> {'size', 'created', 'accessed'} ordered from least to most recently used
+_pinned = {}  # Filename -> number of renders currently writing it
+_bytes = 0
+
+stats = {
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0,
+}
+
+
+def get_index() -> OrderedDict:
+
+    """Return the index of cached plots, building it from the images folder on first use."""
+
+    global _index, _bytes
+
+    if _index is None:
+        entries = []
+        for entry in os.scandir(IMAGE_DIR):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.name, {'size': stat.st_size, 'created': stat.st_mtime, 'accessed': stat.st_atime}))
+
+        _index = OrderedDict((name, info) for _, name, info in sorted(entries))
+        _bytes = sum(info['size'] for info in _index.values())
+
+    return _index
+
+
+def is_expired(info: dict, now: float) -> bool:
+
+    """Check if a cached plot has outlived its time to live."""
+
+    return TTL > 0 and now - info['created'] > TTL
+
+
+def lookup(filename: str) -> bool:
+
+    """Check if a plot is cached and still valid, recording a hit or a miss."""
+
+    index = get_index()
+    now = time.time()
+
+    info = index.get(filename)
+    if info is None or is_expired(info, now) or not os.path.isfile(os.path.join(IMAGE_DIR, filename)):
+        if info is not None and filename not in _pinned:
+            remove(filename)
+        stats['misses'] += 1
+        return False
+
+    info['accessed'] = now
+    index.move_to_end(filename)
+    stats['hits'] += 1
+
+    return True
+
+
+def add(filename: str):
+
+    """Register a newly rendered plot and evict old plots if the folder is over budget."""
+
+    global _bytes
+
+    index = get_index()
+    now = time.time()
+
+    if filename in index:
+        _bytes -= index.pop(filename)['size']
+
+    size = os.path.getsize(os.path.join(IMAGE_DIR, filename))
+    index[filename] = {'size': size, 'created': now, 'accessed': now}
+    _bytes += size
+
+    evict()
+
+
+def remove(filename: str):
+
+    """Delete a plot from the cache and from disk."""
+
+    global _bytes
+
+    info = get_index().pop(filename, None)
+    if info is not None:
+        _bytes -= info['size']
+
+    try:
+        os.remove(os.path.join(IMAGE_DIR, filename))
+    except FileNotFoundError:
+        pass
+
+
+def evict():
+
+    """Remove expired plots, then the least recently used plots until the folder is within budget."""
+
+    index = get_index()
+    now = time.time()
+
+    for filename in [name for name, info in index.items() if is_expired(info, now)]:
+        if filename not in _pinned and now - index[filename]['accessed'] > GRACE:
+            remove(filename)
+            stats['evictions'] += 1
+
+    for filename in list(index.keys()):
+        if _bytes <= BUDGET_BYTES:
+            break
+        if filename in _pinned or now - index[filename]['accessed'] <= GRACE:
+            continue
+        remove(filename)
+        stats['evictions'] += 1
+
+
+def remove_dataset(dataset: str):
+
+    """Delete every cached plot of a dataset (e.g. after its recording has changed)."""
+
+    for filename in [name for name in get_index().keys() if name.startswith(f'{dataset}_')]:
+        if filename not in _pinned:
+            remove(filename)
+
+
+@contextmanager
+def pin(filename: str):
+
+    """Protect a plot from eviction while it is being rendered."""
+
+    _pinned[filename] = _pinned.get(filename, 0) + 1
+    try:
+        yield
+    finally:
+        _pinned[filename] -= 1
+        if _pinned[filename] == 0:
+            del _pinned[filename]
+
+
+def get_stats() -> dict:
+
+    """Return the cache counters along with the current size of the cache."""
+
+    index = get_index()
+
+    return {**stats, 'files': len(index), 'bytes': _bytes, 'budgetBytes': BUDGET_BYTES}
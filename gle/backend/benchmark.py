@@ -0,0 +1,95 @@
+import asyncio
+import json
+import time
+import sys
+import numpy as np
+import reader as r
+import plotter as p
+import figures as fg
+import utils as u
+
+"""
+This module times the renders of the plots we serve. Run it with `python benchmark.py [repeats]` from the backend
+folder to compare changes to the plotting code."""
+
+
+# Datasets (excitation type and shaker position) used for the benchmark
+CASES = [
+    ('Hammer testing', 0),
+    ('Random', 1),
+]
+
+# Plots timed for each dataset, with the label layouts compared on the plots that have labels
+PLOTS = {
+    'bode': p.plot_bode,
+    'nyquist': p.plot_nyquist,
+}
+
+
+def adjust_text_labels(ax, labels: list, arrowprops: dict = None) -> list:
+
+    """Place labels with adjustText (the previous layout) so that it can be compared with figures.place_labels."""
+
+    from adjustText import adjust_text
+
+    texts = [ax.text(x, y, text, horizontalalignment='center', verticalalignment='bottom', **style) for x, y, text, style in labels]
+    target_x = [x for x, _, _, _ in labels]
+    target_y = [y for _, y, _, _ in labels]
+
+    if arrowprops is None:
+        adjust_text(texts, ax=ax)
+    else:
+        adjust_text(texts, ax=ax, target_x=target_x, target_y=target_y, arrowprops=arrowprops)
+
+    return texts
+
+
+def time_render(func, data, options: dict, repeats: int) -> np.ndarray:
+
+    """Render a plot several times and return the duration of each render in seconds."""
+
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        asyncio.run(func(data, dict(options)))
+        durations.append(time.perf_counter() - start)
+
+    return np.array(durations)
+
+
+def run(repeats: int = 5):
+
+    """Print the render time of each plot with the slot layout and, if it is installed, with adjustText."""
+
+    layouts = {'slots': fg.place_labels}
+    try:
+        import adjustText
+    except ImportError:
+        print('adjustText is not installed, only timing the slot layout')
+    else:
+        layouts['adjustText'] = adjust_text_labels
+
+    with open('./templates/requestFormat.json') as f:
+        template = json.load(f)
+
+    print(f"{'dataset':<12}{'plot':<10}{'layout':<12}{'mean [ms]':>10}{'min [ms]':>10}")
+
+    place_labels = fg.place_labels
+    try:
+        for excitation, shaker_position in CASES:
+            options = {**template, 'excitationType': excitation, 'shakerPosition': shaker_position}
+            data = r.read_csv(options)
+
+            for plot_type, func in PLOTS.items():
+                time_render(func, data, options, 1)  # Fill the spectrum and layer caches first
+
+                for layout, place in layouts.items():
+                    fg.place_labels = place
+                    durations = time_render(func, data, options, repeats) * 1000
+                    print(f"{u.format_filename(options):<12}{plot_type:<10}{layout:<12}{durations.mean():>10.0f}{durations.min():>10.0f}")
+    finally:
+        fg.place_labels = place_labels
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,90 @@
+import numpy as np
+
+"""
+This module reduces long traces to roughly one point per pixel column before they are drawn or sent to the
+frontend, while keeping their visual shape."""
+
+
+def minmax_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+
+    """
+    Select the minimum and maximum of each bucket of a trace.
+
+    Parameters
+    ----------
+    y : np.ndarray
+        1-D array of values (or 2-D array with one trace per row, in which case the selection covers every trace).
+    n_buckets : int
+        Number of equally sized buckets, e.g. the number of pixel columns.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted indices of the selected points, always including the first and last point.
+    """
+
+    y = np.atleast_2d(y)
+    n = y.shape[1]
+
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+
+    # Pad with the last value so that the trace splits into equally sized buckets
+    size = int(np.ceil(n / n_buckets))
+    padded = np.pad(y, ((0, 0), (0, size * n_buckets - n)), mode='edge').reshape(y.shape[0], n_buckets, size)
+
+    offsets = np.arange(n_buckets) * size
+    idx_min = padded.argmin(axis=2) + offsets
+    idx_max = padded.argmax(axis=2) + offsets
+
+    indices = np.concatenate([[0, n - 1], idx_min.ravel(), idx_max.ravel()])
+
+    return np.unique(np.minimum(indices, n - 1))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+
+    """
+    Select points using the Largest-Triangle-Three-Buckets algorithm.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        1-D array of (increasing) x values.
+    y : np.ndarray
+        1-D array of y values.
+    n_out : int
+        Number of points to keep.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted indices of the selected points, always including the first and last point.
+    """
+
+    n = len(y)
+
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Bucket edges for the points between the first and last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    indices = np.empty(n_out, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average of the next bucket (or the last point for the final bucket)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        x_next = x[end:next_end].mean()
+        y_next = y[end:next_end].mean()
+
+        # Pick the point forming the largest triangle with the previous selection and the next average
+        x_prev, y_prev = x[indices[i]], y[indices[i]]
+        area = np.abs((x_prev - x_next) * (y[start:end] - y_prev) - (x_prev - x[start:end]) * (y_next - y_prev))
+        indices[i + 1] = start + np.argmax(area)
+
+    return indices
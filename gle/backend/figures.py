@@ -0,0 +1,291 @@
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from contextlib import contextmanager
+import matplotlib
+import numpy as np
+import os
+
+"""
+This module keeps a pool of pre-built, styled figures for each plot type. A render borrows a figure, updates the
+data of its lines and returns it, instead of building a new figure through the global pyplot state. Each figure
+has its own Agg canvas so renders do not share any drawing state."""
+
+
+STYLE = {
+    'font.size': 18,
+    'figure.figsize': (8, 5),
+    'figure.dpi': 300
+}
+
+# Maximum number of idle figures kept for each plot type
+POOL_SIZE = int(os.environ.get('FIGURE_POOL_SIZE', 2))
+
+ACCELEROMETERS = ['A0', 'A1', 'A2', 'A3', 'A4']
+
+_builders = {}
+_pool = {}  # Plot type -> idle figures
+
+
+def builder(plot_type: str):
+
+    """Register the function that builds the figure of a plot type."""
+
+    def register(func):
+        _builders[plot_type] = func
+        return func
+
+    return register
+
+
+def styled():
+
+    """Apply STYLE to the figures built and drawn within a with block, without changing the global rcParams."""
+
+    return matplotlib.rc_context(STYLE)
+
+
+def new_figure(nrows: int = 1, ncols: int = 1, **kwargs):
+
+    """Create a styled figure with its own Agg canvas and return it along with its axes."""
+
+    with styled():
+        fig = Figure(figsize=kwargs.pop('figsize', STYLE['figure.figsize']), dpi=kwargs.pop('dpi', STYLE['figure.dpi']))
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(nrows, ncols, **kwargs)
+
+    return fig, axes
+
+
+def accelerometer_lines(ax, **kwargs) -> dict:
+
+    """Create one hidden line per accelerometer, each with a fixed colour."""
+
+    lines = {}
+    for index, acc in enumerate(ACCELEROMETERS):
+        lines[acc], = ax.plot([], [], color=f'C{index}', label=acc, visible=False, **kwargs)
+
+    return lines
+
+
+def template(fig, axes: list, lines: dict) -> dict:
+
+    """Bundle a figure with its artists, remembering which artists belong to the empty figure."""
+
+    return {
+        'figure': fig,
+        'axes': axes,
+        'lines': lines,
+        'base': {ax: set(ax.get_children()) for ax in axes},
+        'autoscale': {ax: (ax.get_autoscalex_on(), ax.get_autoscaley_on(), ax.get_aspect()) for ax in axes},
+    }
+
+
+@builder('accel')
+def build_acceleration() -> dict:
+    fig, ax = new_figure()
+    lines = accelerometer_lines(ax)
+    ax.set_xlabel('Time [s]')
+    ax.set_ylabel(r'Acceleration [g]')
+    ax.set_title('Raw Acceleration Data')
+    ax.grid(True)
+
+    return template(fig, [ax], lines)
+
+
+@builder('force')
+def build_forcing() -> dict:
+    fig, ax = new_figure()
+    lines = {'F0': ax.plot([], [], color='C0')[0]}
+    ax.set_xlabel('Time [s]')
+    ax.set_ylabel('Force [N]')
+    ax.set_title('Raw Forcing Data')
+    ax.grid(True)
+
+    return template(fig, [ax], lines)
+
+
+@builder('dft')
+def build_dft() -> dict:
+    fig, ax = new_figure()
+    lines = accelerometer_lines(ax, marker='o', linestyle='none', markersize=np.sqrt(10))  # Same size as a scatter with s=10
+    ax.set_xlabel('Frequency [Hz]')
+    ax.set_ylabel('Amplitude')
+    ax.set_title('Discrete Fourier Transform of Acceleration')
+    ax.grid(True)
+    ax.set_xlim(0, 1000)  # Set limits for the x-axis (frequency)
+
+    return template(fig, [ax], lines)
+
+
+@builder('bode')
+def build_bode() -> dict:
+    fig, (ax_gain, ax_phase) = new_figure(2, 1)
+    lines = {'gain': accelerometer_lines(ax_gain), 'phase': accelerometer_lines(ax_phase)}
+    ax_gain.set_ylabel('Gain [dB]')
+    ax_gain.grid(True, which="both")
+    ax_phase.set_xlabel('Frequency [Hz]')
+    ax_phase.set_ylabel('Phase [rad]')
+    ax_phase.grid(True, which="both")
+
+    return template(fig, [ax_gain, ax_phase], lines)
+
+
+@builder('nyquist')
+def build_nyquist() -> dict:
+    fig, ax = new_figure()
+    ax.set_xlabel('Re', fontsize=18)
+    ax.set_ylabel('Im', fontsize=18)
+    ax.grid(True)
+    ax.tick_params(labelbottom=False, labelleft=False)  # Only the shape of the circle matters
+
+    return template(fig, [ax], {})
+
+
+@builder('mode-shapes')
+def build_mode_shapes() -> dict:
+    fig, ax = new_figure()
+    ax.axhline(0, color='black', linewidth=0.5)  # Center the graph around the x-axis
+    ax.set_xlabel('Accelerometer location')
+    ax.set_ylabel('Normalised Abs(Receptance FRF)')
+
+    return template(fig, [ax], {})
+
+
+def reset(figure: dict):
+
+    """Remove everything a render added to a pooled figure and hide its lines."""
+
+    for ax, base in figure['base'].items():
+        for artist in ax.get_children():
+            if artist not in base:
+                artist.remove()
+
+    # Limits and aspect set by a render must not carry over to the next one
+    for ax, (x_on, y_on, aspect) in figure['autoscale'].items():
+        ax.set_autoscalex_on(x_on)
+        ax.set_autoscaley_on(y_on)
+        ax.set_aspect(aspect)
+
+    lines = figure['lines'].values()
+    if figure['lines'] and isinstance(next(iter(lines)), dict):
+        lines = [line for group in lines for line in group.values()]
+
+    for line in lines:
+        line.set_data([], [])
+        line.set_visible(False)
+
+
+@contextmanager
+def acquire(plot_type: str):
+
+    """
+    Borrow a pre-built figure of a plot type for one render.
+
+    Parameters
+    ----------
+    plot_type : str
+        Type of plot (e.g. 'bode'), as registered with builder.
+
+    Yields
+    ------
+    dict
+        Dictionary containing the following keys:
+            - 'figure': The matplotlib Figure.
+            - 'axes': List of the axes of the figure.
+            - 'lines': Pre-built lines (keyed by channel) whose data the render updates.
+    """
+
+    idle = _pool.setdefault(plot_type, [])
+
+    # Text added by the render and tick labels created when the figure is drawn are styled too
+    with styled():
+        figure = idle.pop() if idle else _builders[plot_type]()
+
+        try:
+            yield figure
+        finally:
+            reset(figure)
+            if len(idle) < POOL_SIZE:
+                idle.append(figure)
+
+
+def autoscale(ax):
+
+    """Rescale the axes to the visible lines after their data has changed."""
+
+    ax.relim(visible_only=True)
+    ax.autoscale_view()
+
+
+# Offsets (in points) tried in order for each label: above and below the point, then further out on either side
+LABEL_SLOTS = [(0, 8), (0, -8), (45, 8), (-45, 8), (45, -8), (-45, -8), (0, 32), (0, -32), (90, 24), (-90, 24), (90, -24), (-90, -24)]
+
+
+def overlap(a: tuple, b: tuple) -> float:
+
+    """Return the overlapping area of two boxes (x0, y0, x1, y1)."""
+
+    return max(0, min(a[2], b[2]) - max(a[0], b[0])) * max(0, min(a[3], b[3]) - max(a[1], b[1]))
+
+
+def place_labels(ax, labels: list, arrowprops: dict = None) -> list:
+
+    """
+    Annotate points with labels placed in the first free slot around each point.
+
+    Every label tries the same fixed list of offsets (LABEL_SLOTS) and takes the first one that neither overlaps a
+    label placed before it nor leaves the axes, or the least overlapping one if none is free. The cost is bounded by
+    the number of labels times the number of slots, and the layout only depends on the data. Label sizes are
+    estimated from their font size so that nothing needs to be drawn first. The axes limits must be final.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axes to annotate.
+    labels : list
+        List of (x, y, text, style) tuples where x and y are the point in data coordinates and style is a dictionary
+        of text properties (e.g. {'color': 'red'}).
+    arrowprops : dict, optional
+        Properties of arrows drawn from each label to its point.
+
+    Returns
+    -------
+    list
+        The annotations that were added.
+    """
+
+    if not labels:
+        return []
+
+    ax.apply_aspect()  # Make sure the axes box is final when the aspect ratio is fixed
+    scale = 72 / ax.figure.dpi  # Pixels to points
+    x0, y0, x1, y1 = ax.bbox.extents * scale
+    points = ax.transData.transform([(x, y) for x, y, _, _ in labels]) * scale
+
+    # Labels should not hide the points they annotate
+    placed = [(px - 3, py - 3, px + 3, py + 3) for px, py in points]
+    annotations = []
+
+    for (x, y, text, style), (px, py) in zip(labels, points):
+        size = style.get('size', style.get('fontsize', matplotlib.rcParams['font.size']))
+        width = 0.6 * size * len(text)
+        height = 1.2 * size
+
+        best = None
+        for dx, dy in LABEL_SLOTS:
+            bottom = py + dy if dy >= 0 else py + dy - height
+            box = (px + dx - width/2, bottom, px + dx + width/2, bottom + height)
+
+            # Area overlapping other labels plus area outside the axes
+            cost = sum(overlap(box, other) for other in placed) + width*height - overlap(box, (x0, y0, x1, y1))
+            if best is None or cost < best[0]:
+                best = (cost, dx, dy, box)
+            if cost == 0:
+                break
+
+        _, dx, dy, box = best
+        placed.append(box)
+        annotations.append(ax.annotate(text, (x, y), xytext=(dx, dy), textcoords='offset points', horizontalalignment='center',
+                                       verticalalignment='bottom' if dy >= 0 else 'top', arrowprops=arrowprops, **style))
+
+    return annotations
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+import os
+import spectral as s
+import downsample as ds
+import utils as u
+
+"""
+This module keeps the plot-ready traces of each channel (a layer) so that a plot of any accelerometer selection is
+assembled from cached layers rather than recomputed. The cache grows with the number of channels instead of the
+number of possible selections."""
+
+
+# Maximum number of channel layers held in memory
+CACHE_SIZE = int(os.environ.get('LAYER_CACHE_SIZE', 256))
+
+_cache = u.LRU(CACHE_SIZE)
+
+
+def get_layer(key: tuple, build) -> dict:
+
+    """Return a cached layer, building it on first use."""
+
+    def build_read_only():
+        layer = build()
+
+        # Layers are shared between plots so they must not be modified
+        for values in layer.values():
+            if isinstance(values, np.ndarray):
+                values.flags.writeable = False
+
+        return layer
+
+    return _cache.get(key, build_read_only)
+
+
+def trace(data: pd.DataFrame, options: dict, column: str, n_buckets: int) -> dict:
+
+    """
+    Return the time trace of one channel, reduced to the minimum and maximum of each bucket.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the channel data and corresponding time data.
+    options : dict
+        Dictionary of options sent with the request.
+    column : str
+        Name of the channel (e.g. 'A0' or 'F0').
+    n_buckets : int
+        Number of buckets, e.g. the number of pixel columns of the plot.
+
+    Returns
+    -------
+    dict
+        Dictionary containing the time axis 't' and the channel values 'y'.
+    """
+
+    def build():
+        t = data['t'].to_numpy()
+        y = data[column].to_numpy()
+        idx = ds.minmax_indices(y, n_buckets)
+        return {'t': t[idx], 'y': y[idx]}
+
+    return get_layer((s.dataset_key(data, options), column, 'trace', n_buckets), build)
+
+
+def amplitude(data: pd.DataFrame, options: dict, acc: str, n_buckets: int, f_max: float = 1000) -> dict:
+
+    """
+    Return the amplitude spectrum of one accelerometer up to f_max, reduced to the minimum and maximum of each bucket.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the acceleration data and corresponding force data.
+    options : dict
+        Dictionary of options sent with the request.
+    acc : str
+        Name of the accelerometer (e.g. 'A0').
+    n_buckets : int
+        Number of buckets, e.g. the number of pixel columns of the plot.
+    f_max : float, optional
+        Highest frequency kept.
+
+    Returns
+    -------
+    dict
+        Dictionary containing the frequency axis 'f' and the amplitude 'amplitude'.
+    """
+
+    def build():
+        spectrum = s.get_spectrum(data, options)
+        valid_idx = u.band(spectrum['f'], f_max=f_max)
+        f = spectrum['f'][valid_idx]
+        y = np.abs(spectrum['accel'][s.channel_rows([acc])[0]][valid_idx])
+        idx = ds.minmax_indices(y, n_buckets)
+        return {'f': f[idx], 'amplitude': y[idx]}
+
+    return get_layer((s.dataset_key(data, options), acc, 'amplitude', n_buckets, float(f_max)), build)
+
+
+def bode(data: pd.DataFrame, options: dict, acc: str, plot_type: str, f_min: float, f_max: float) -> dict:
+
+    """
+    Return the gain and phase of one accelerometer's FRF within a band, along with its peak and half-power points.
+    The FRF is estimated as requested in the options (see spectral.get_frfs).
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the acceleration data and corresponding force data.
+    options : dict
+        Dictionary of options sent with the request.
+    acc : str
+        Name of the accelerometer (e.g. 'A0').
+    plot_type : str
+        Type of FRF. Options are 'Mobility', 'Receptance' or 'Inertance'.
+    f_min, f_max : float
+        Band of frequencies kept.
+
+    Returns
+    -------
+    dict
+        Dictionary containing the following keys:
+            - 'f': The frequency axis within the band.
+            - 'gain': The gain in dB.
+            - 'phase': The phase in rad.
+            - 'peak': Index of the peak gain (None if the band is empty, e.g. inverted).
+            - 'f1', 'f2': Frequencies of the half-power (-3 dB) points either side of the peak, interpolated between
+                          bins (None if not found).
+            - 'coherence': Only with the H1 and H2 estimators. The coherence within the band.
+    """
+
+    def build():
+        spectrum = s.get_frfs(data, options)
+        f = spectrum['f']
+        row = s.channel_rows([acc])[0]
+        frf = s.get_frf(spectrum, plot_type)[row]
+
+        valid_idx = u.band(f, f_min, f_max)
+        gain = 20 * np.log10(np.abs(frf[valid_idx]))  # Convert to dB
+        phase = np.angle(frf[valid_idx])
+
+        # Find peak magnitude and where the magnitude first drops to the half-power (-3 dB) level either side of it
+        idx_peak, idx_f1, idx_f2 = None, None, None
+        if len(gain) > 0:
+            idx_peak = int(np.argmax(gain))
+            idx_f1, idx_f2 = u.half_power_points(gain, idx_peak)
+
+        layer = {
+            'f': f[valid_idx],
+            'gain': gain,
+            'phase': phase,
+            'peak': idx_peak,
+            'f1': u.frequency_at(f[valid_idx], idx_f1) if idx_f1 is not None else None,
+            'f2': u.frequency_at(f[valid_idx], idx_f2) if idx_f2 is not None else None,
+        }
+        if 'coherence' in spectrum:
+            layer['coherence'] = spectrum['coherence'][row][valid_idx]
+
+        return layer
+
+    estimator = tuple(u.estimator_settings(options).values())
+
+    return get_layer((s.dataset_key(data, options), acc, 'bode', plot_type, float(f_min), float(f_max)) + estimator, build)
+
+
+def clear_cache():
+
+    """Empty the layer cache."""
+
+    _cache.clear()
@@ -0,0 +1,279 @@
+from scipy.signal import find_peaks
+import numpy as np
+import pandas as pd
+import hashlib
+import json
+import os
+import spectral as s
+import utils as u
+
+"""
+This module extracts the modal parameters of a dataset (natural frequencies, damping ratios and mode shapes) as
+numbers, so that results can be checked without rendering any plot. It uses the same FRFs as the Bode, Nyquist and
+mode shape plots."""
+
+
+# Maximum number of results held in memory
+CACHE_SIZE = int(os.environ.get('MODAL_CACHE_SIZE', 64))
+
+# Minimum prominence (in dB) of a peak in the gain for it to count as a mode
+PROMINENCE = float(os.environ.get('MODE_PROMINENCE', 6))
+
+# Peaks further than this (in dB) below the highest peak in the band are treated as noise
+DYNAMIC_RANGE = float(os.environ.get('MODE_DYNAMIC_RANGE', 30))
+
+_cache = u.LRU(CACHE_SIZE)
+
+
+def pick_peaks(gain: np.ndarray) -> np.ndarray:
+
+    """Return the indices of the modes in a gain curve, or of its maximum if no peak stands out."""
+
+    peaks, _ = find_peaks(gain, prominence=PROMINENCE, height=np.max(gain) - DYNAMIC_RANGE)
+
+    if len(peaks) == 0:
+        peaks = np.array([np.argmax(gain)])
+
+    return peaks
+
+
+def mode_ranges(peaks: np.ndarray, n: int) -> list:
+
+    """Split a band into one range of indices per mode, with boundaries halfway between neighbouring peaks."""
+
+    bounds = np.concatenate(([0], (peaks[:-1] + peaks[1:]) // 2, [n - 1]))
+
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def half_power(f: np.ndarray, gain: np.ndarray, peak: int, lo: int, hi: int) -> dict:
+
+    """
+    Estimate the damping ratio of a mode from its half-power (-3 dB) bandwidth.
+
+    Parameters
+    ----------
+    f : np.ndarray
+        Frequency axis.
+    gain : np.ndarray
+        Gain in dB.
+    peak : int
+        Index of the mode.
+    lo, hi : int
+        Range of indices that belongs to the mode.
+
+    Returns
+    -------
+    dict
+        Dictionary containing the half-power frequencies 'f1' and 'f2', interpolated between bins, and the
+        'dampingRatio' (None if a half-power point is outside the range).
+    """
+
+    # Where the magnitude first drops to the half-power level either side of the peak, to a fraction of a bin
+    idx_f1, idx_f2 = u.half_power_points(gain, peak, lo, hi)
+
+    f1 = u.frequency_at(f, idx_f1) if idx_f1 is not None else None
+    f2 = u.frequency_at(f, idx_f2) if idx_f2 is not None else None
+
+    return {
+        'f1': f1,
+        'f2': f2,
+        'dampingRatio': float((f2 - f1) / (2 * f[peak])) if f1 is not None and f2 is not None else None,
+    }
+
+
+def circle_fit(f: np.ndarray, frfs: np.ndarray, ranges: list, plot_type: str) -> list:
+
+    """
+    Fit circles to the Nyquist plots of several modes at once and estimate their natural frequencies and damping ratios.
+
+    The ranges of every mode are padded to the same width so that all the fits are solved together (see
+    utils.circfit_batch). The natural frequency is the point furthest along the real (mobility) or imaginary
+    (receptance) axis and the half-power points are the points closest to the top and bottom (mobility) or sides
+    (receptance) of the circle, as drawn on the Nyquist plot.
+
+    Parameters
+    ----------
+    f : np.ndarray
+        Frequency axis.
+    frfs : np.ndarray
+        Complex FRFs with one row per accelerometer.
+    ranges : list
+        List of (row, lo, hi) tuples: the FRF row and the range of indices that belong to each mode.
+    plot_type : str
+        Type of FRF. Options are 'Mobility' or 'Receptance'.
+
+    Returns
+    -------
+    list
+        For each mode, a dictionary containing the 'centre', 'radius' and 'rmse' of the circle, the
+        'naturalFrequency', the half-power frequencies 'f1' and 'f2' and the 'dampingRatio' (None if the mode has
+        fewer than three points).
+    """
+
+    if not ranges:
+        return []
+
+    rows, lo, hi = (np.array(values) for values in zip(*ranges))
+
+    # Pad every range to the widest one and mask the padding
+    offsets = np.arange(np.max(hi - lo) + 1)
+    mask = offsets <= (hi - lo)[:, None]
+    idx = np.minimum(lo[:, None] + offsets, hi[:, None])
+    points = frfs[rows[:, None], idx]
+    x = np.real(points)
+    y = np.imag(points)
+    z = f[idx]
+
+    r, xc, yc, rmse = u.circfit_batch(x, y, mask)
+
+    if plot_type == 'Receptance':
+        idx_n = np.argmax(np.where(mask, np.abs(y), -np.inf), axis=1)
+        idx_h = np.argmin(np.where(mask, np.abs(x - (xc + r)[:, None]), np.inf), axis=1)
+        idx_l = np.argmin(np.where(mask, np.abs(x - (xc - r)[:, None]), np.inf), axis=1)
+    else:
+        idx_n = np.argmax(np.where(mask, np.abs(x), -np.inf), axis=1)
+        idx_h = np.argmin(np.where(mask, np.abs(y - (yc + r)[:, None]), np.inf), axis=1)
+        idx_l = np.argmin(np.where(mask, np.abs(y - (yc - r)[:, None]), np.inf), axis=1)
+
+    modes = np.arange(len(rows))
+    f_n = z[modes, idx_n]
+    f1 = np.minimum(z[modes, idx_l], z[modes, idx_h])
+    f2 = np.maximum(z[modes, idx_l], z[modes, idx_h])
+    damping = (f2 - f1) / (2 * f_n)
+
+    fits = []
+    for i in modes:
+        if np.isnan(r[i]):
+            fits.append(None)
+            continue
+
+        fits.append({
+            'centre': [float(xc[i]), float(yc[i])],
+            'radius': float(r[i]),
+            'rmse': float(rmse[i]),
+            'naturalFrequency': float(f_n[i]),
+            'f1': float(f1[i]),
+            'f2': float(f2[i]),
+            'dampingRatio': float(damping[i]),
+        })
+
+    return fits
+
+
+def extract(data: pd.DataFrame, options: dict, plot_type: str = 'Mobility') -> dict:
+
+    """
+    Extract the modal parameters of the selected accelerometers within the requested band.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the acceleration data and corresponding force data.
+    options : dict
+        Dictionary of options sent with the request (FRF estimation options are honoured, see spectral.get_frfs).
+    plot_type : str, optional
+        Type of FRF used for peak picking and circle fitting. Options are 'Mobility' or 'Receptance'.
+
+    Returns
+    -------
+    dict
+        Dictionary containing the following keys:
+            - 'frfType': The type of FRF used.
+            - 'band': The lowest and highest frequency searched.
+            - 'accelerometers': For each accelerometer, the list of its modes with the 'naturalFrequency' and 'gain'
+                                at the peak, the 'halfPower' estimate and the 'circleFit' estimate.
+            - 'modeShapes': For each mode of the first accelerometer, its 'naturalFrequency' and the normalised
+                            imaginary part of the receptance of each accelerometer ('shape').
+    """
+
+    active = [acc for acc in options['accelerometers'].keys() if options['accelerometers'][acc]]
+
+    # Filter for desired frequency range
+    f_min = max(options['lowerCutoff'], 10)
+    f_max = min(options['upperCutoff'], 1000)
+
+    spectrum = s.get_frfs(data, options)
+    valid_idx = u.band(spectrum['f'], f_min, f_max)
+    f = spectrum['f'][valid_idx]
+    rows = s.channel_rows(active)
+    frfs = s.get_frf(spectrum, plot_type)[rows][:, valid_idx]
+    receptance = spectrum['receptance'][rows][:, valid_idx]
+
+    # An empty or inverted band (e.g. both cutoffs left at 0) has no modes in it
+    if len(f) == 0:
+        return {
+            'frfType': plot_type,
+            'band': [float(f_min), float(f_max)],
+            'accelerometers': {acc: {'modes': []} for acc in active},
+            'modeShapes': [],
+        }
+
+    results = {}
+    reference_peaks = None
+    ranges = []
+    for row, (acc, frf) in enumerate(zip(active, frfs)):
+        gain = 20 * np.log10(np.abs(frf))  # Convert to dB
+        peaks = pick_peaks(gain)
+        if reference_peaks is None:
+            reference_peaks = peaks
+
+        modes = []
+        for peak, (lo, hi) in zip(peaks, mode_ranges(peaks, len(f))):
+            modes.append({
+                'naturalFrequency': float(f[peak]),
+                'gain': float(gain[peak]),
+                'halfPower': half_power(f, gain, peak, lo, hi),
+            })
+            ranges.append((row, lo, hi))
+
+        results[acc] = {'modes': modes}
+
+    # Fit the circles of every mode of every accelerometer in one pass
+    fits = iter(circle_fit(f, frfs, ranges, plot_type))
+    for acc in active:
+        for mode in results[acc]['modes']:
+            mode['circleFit'] = next(fits)
+
+    # Mode shapes from the imaginary part of the receptance at each mode of the first accelerometer
+    mode_shapes = []
+    for peak in (reference_peaks if reference_peaks is not None else []):
+        shape = np.imag(receptance[:, peak])
+        max_abs_value = np.max(np.abs(shape)) if np.any(shape) else 1  # Avoid division by zero
+        mode_shapes.append({
+            'naturalFrequency': float(f[peak]),
+            'shape': {acc: float(value) for acc, value in zip(active, shape / max_abs_value)},
+        })
+
+    return {
+        'frfType': plot_type,
+        'band': [float(f_min), float(f_max)],
+        'accelerometers': results,
+        'modeShapes': mode_shapes,
+    }
+
+
+def get_modal_parameters(data: pd.DataFrame, options: dict, plot_type: str = 'Mobility') -> dict:
+
+    """Return the cached modal parameters of a dataset, extracting them on first use."""
+
+    canonical = u.canonical_options(options, 'modal')
+    digest = hashlib.sha1(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+    key = s.dataset_key(data, options) + (plot_type, digest)
+
+    return _cache.get(key, lambda: extract(data, options, plot_type))
+
+
+def clear_cache():
+
+    """Empty the modal parameter cache."""
+
+    _cache.clear()
+
+
+if __name__ == '__main__':
+    import reader as r
+    with open('./templates/requestFormat.json') as f:
+        options = json.load(f)
+    data = r.read_csv(options)
+    print(json.dumps(get_modal_parameters(data, options), indent=2))
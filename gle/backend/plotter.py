@@ -1,22 +1,36 @@
 from matplotlib import pyplot as plt
+from matplotlib.patches import Circle
 import numpy as np
 import pandas as pd
 import utils as u
+import reader as r
+import spectral as s
+import layers as l
+import figures as fg
 from mpl_toolkits.mplot3d import Axes3D  # Import 3D plotting module
 from scipy.signal import find_peaks
-from adjustText import adjust_text
 from scipy.signal import find_peaks
  
 
-plt.rcParams.update({
-    'font.size': 18,
-    'figure.figsize': (8, 5),
-    'figure.dpi': 300
-})
-
 locations = ['0', 'l/4', 'l/2', '3l/4', 'l']
 
 
+def pixel_columns(options: dict) -> int:
+
+    """Return the number of pixel columns across a figure, used to downsample long traces before drawing them."""
+
+    return int(fg.STYLE['figure.figsize'][0] * u.output_settings(options)['dpi'])
+
+
+def save_plot(fig, plot_path: str, options: dict, plot_type: str, **kwargs):
+
+    """Save a figure in the file format and resolution requested in the options."""
+
+    settings = u.output_settings(options, plot_type)
+    with fg.styled():
+        fig.savefig(plot_path, format=settings['format'], dpi=settings['dpi'], **kwargs)
+
+
 async def plot_acceleration(data: pd.DataFrame, options: dict):
 
     """
@@ -40,19 +54,24 @@ async def plot_acceleration(data: pd.DataFrame, options: dict):
 
     accelerometers = options['accelerometers']
 
-    for index, acc in enumerate(accelerometers.keys()):
-        if accelerometers[acc]:
-            plt.plot(data['t'], data[acc], label=acc)
+    plot_path = f'./images/{u.format_plot_name(options, "accel")}'
 
-    plot_path = f'./images/{u.format_accel_plot_name(options, "accel")}'
-    
-    plt.xlabel('Time [s]')
-    plt.ylabel(r'Acceleration [g]')
-    plt.title('Raw Acceleration Data')
-    plt.legend()
-    plt.grid(True)
-    plt.savefig(plot_path, bbox_inches='tight', pad_inches=0.5)
-    plt.close()
+    with fg.acquire('accel') as figure:
+        ax, = figure['axes']
+        active = []
+
+        for acc in accelerometers.keys():
+            if accelerometers[acc]:
+                # Each trace keeps the minimum and maximum of each pixel column so that it looks the same
+                layer = l.trace(data, options, acc, pixel_columns(options))
+                line = figure['lines'][acc]
+                line.set_data(layer['t'], layer['y'])
+                line.set_visible(True)
+                active.append(line)
+
+        fg.autoscale(ax)
+        ax.legend(handles=active)
+        save_plot(figure['figure'], plot_path, options, "accel", bbox_inches='tight', pad_inches=0.5)
 
     return plot_path
 
@@ -76,15 +95,18 @@ async def plot_forcing(data: pd.DataFrame, options: dict):
         The file path where the plot image is saved.
     """
 
-    plot_path = f'./images/{u.format_filename(options)}_{options['samplingFreq']}_force.png'
+    plot_path = f'./images/{u.format_plot_name(options, "force")}'
+
+    # Keep the minimum and maximum of each pixel column so that the trace looks the same
+    layer = l.trace(data, options, 'F0', pixel_columns(options))
+
+    with fg.acquire('force') as figure:
+        line = figure['lines']['F0']
+        line.set_data(layer['t'], layer['y'])
+        line.set_visible(True)
 
-    plt.plot(data['t'], data['F0'])
-    plt.xlabel('Time [s]')
-    plt.ylabel('Force [N]')
-    plt.title('Raw Forcing Data')
-    plt.grid(True)
-    plt.savefig(plot_path, bbox_inches='tight', pad_inches=0.5)
-    plt.close()
+        fg.autoscale(figure['axes'][0])
+        save_plot(figure['figure'], plot_path, options, "force", bbox_inches='tight', pad_inches=0.5)
 
     return plot_path
 
@@ -111,27 +133,23 @@ async def plot_dft(data: pd.DataFrame, options: dict):
     """
 
     accelerometers = options['accelerometers']
-    sample_rate = options['samplingFreq']
 
-    for acc in accelerometers.keys():
-        if accelerometers[acc]:
-            n = len(data[acc])
-            f = np.fft.fftfreq(n, 1/sample_rate)
-            f = f[:n//2]
-            fft = np.abs(np.fft.fft(data[acc]))[:n//2]
+    active = [acc for acc in accelerometers.keys() if accelerometers[acc]]
 
-            plt.scatter(f, fft, s=10, label=acc)
+    plot_path = f'./images/{u.format_plot_name(options, "dft")}'
 
-    plot_path = f'./images/{u.format_accel_plot_name(options, "dft")}'
+    with fg.acquire('dft') as figure:
+        ax, = figure['axes']
 
-    plt.xlabel('Frequency [Hz]')
-    plt.ylabel('Amplitude')
-    plt.title('Discrete Fourier Transform of Acceleration')
-    plt.legend()
-    plt.grid(True)
-    plt.xlim(0, 1000)  # Set limits for the x-axis (frequency)
-    plt.savefig(plot_path, bbox_inches='tight')
-    plt.close()          
+        for acc in active:
+            layer = l.amplitude(data, options, acc, pixel_columns(options))
+            line = figure['lines'][acc]
+            line.set_data(layer['f'], layer['amplitude'])
+            line.set_visible(True)
+
+        fg.autoscale(ax)
+        ax.legend(handles=[figure['lines'][acc] for acc in active])
+        save_plot(figure['figure'], plot_path, options, "dft", bbox_inches='tight')
 
     return plot_path
 
@@ -153,70 +171,54 @@ async def plot_nyquist(data: pd.DataFrame, options: dict, plot_type: str = 'Mobi
     """
 
     accelerometers = options['accelerometers']
-    sample_rate = options['samplingFreq']
 
     # Filter for desired frequency range
     f_min=max(options['lowerCutoff'], 10)
     f_max=min(options['upperCutoff'], 1000)
 
-    for acc in accelerometers.keys():
-        if accelerometers[acc]:
-            n = len(data[acc])
-            f = np.fft.fftfreq(n, 1/sample_rate)
-            f = f[:n//2]
-            fftacc = (np.fft.fft(data[acc]))[:n//2]
-            fftforce = (np.fft.fft(data['F' + acc[1]]))[:n//2]
-            frf = fftacc/fftforce
-
-            # Adjust the frf depending on desired plot type
-            if plot_type == 'Mobility':
-                frf_mobility = frf/(1j*f*2*np.pi)  # Convert inertance to mobility
-                frf = frf_mobility
-            elif plot_type == 'Receptance':
-                frf_receptance = frf/-((f*2*np.pi)**2)  # Convert inertance to receptance
-                frf = frf_receptance
-
-            frfReal = np.real(frf)
-            frfImag = np.imag(frf)
-
-            # Filter for desired frequency range (depends on question that we ask i.e. damping ratio at 2nd mode for e.g.)
-            valid_idx = (f >= f_min) & (f <= f_max)
-            f_filtered=f[valid_idx]
-            frfReal_filtered = frfReal[valid_idx]
-            frfImag_filtered = frfImag[valid_idx]
-
-            xc, yc, r = plotcircfit(frfReal_filtered, frfImag_filtered, f_filtered, plot_type)  # Correct usage
-            break  # Only plot for first accelerometer
-
-    # Labels & Title
-    plt.xlabel('Re', fontsize=18)
-    plt.ylabel('Im', fontsize=18)
-    plt.title(f'Mobility Nyquist plot ({acc})')
-    plt.legend(loc='center left', bbox_to_anchor=(1.05, 0.5))
-    plt.grid(True)
-    plt.xticks(fontsize=18)
-    plt.yticks(fontsize=18)
-    plt.ticklabel_format(style='sci', axis='both', scilimits=(0,2))
-    plt.gca().set_xticklabels([])
-    plt.gca().set_yticklabels([])
-    plt.xlim((xc - r*1.1), (xc + r*1.1))
-    plt.ylim((yc - r*1.1), (yc + r*1.1))
-    plt.gca().set_aspect('equal', adjustable='box')
-
-    plot_path = f'./images/{u.format_accel_plot_name(options, "nyquist")}'
-    plt.savefig(plot_path, bbox_inches='tight')
-    # plt.show()
-    plt.close()
+    spectrum = s.get_frfs(data, options)
+    f = spectrum['f']
+    frfs = s.get_frf(spectrum, plot_type)  # Select the frfs depending on desired plot type
+
+    plot_path = f'./images/{u.format_plot_name(options, "nyquist")}'
+
+    with fg.acquire('nyquist') as figure:
+        ax, = figure['axes']
+
+        for acc in accelerometers.keys():
+            if accelerometers[acc]:
+                frf = frfs[s.channel_rows([acc])[0]]
+
+                frfReal = np.real(frf)
+                frfImag = np.imag(frf)
+
+                # Filter for desired frequency range (depends on question that we ask i.e. damping ratio at 2nd mode for e.g.)
+                valid_idx = u.band(f, f_min, f_max)
+                f_filtered=f[valid_idx]
+                frfReal_filtered = frfReal[valid_idx]
+                frfImag_filtered = frfImag[valid_idx]
+
+                # A circle needs at least three points (an empty or inverted band leaves the plot blank)
+                if len(f_filtered) >= 3:
+                    xc, yc, r = plotcircfit(ax, frfReal_filtered, frfImag_filtered, f_filtered, plot_type)  # Correct usage
+                break  # Only plot for first accelerometer
+
+        # Title & Legend
+        ax.set_title(f'Mobility Nyquist plot ({acc})')
+        ax.legend(loc='center left', bbox_to_anchor=(1.05, 0.5))
+
+        save_plot(figure['figure'], plot_path, options, "nyquist", bbox_inches='tight')
 
     return plot_path
 
 
-def plotcircfit(x, y, z, plot_type):
+def plotcircfit(ax, x, y, z, plot_type):
 
     """
     Fit X-Y data to a circle and create a plot.
 
     Parameters:
+    - ax: Axes to draw on
     - x: 1-D array (list or NumPy array) of X data
     - y: 1-D array (list or NumPy array) of Y data
     - z: 1-D array (list or NumPy array) of Y data
@@ -244,26 +246,30 @@ def plotcircfit(x, y, z, plot_type):
     # ax.set_aspect('equal')
 
     # Plot circle fit
-    circle = plt.Circle((xc, yc), r, color='k', fill=False, linewidth=2, label='Fitted Circle')
-    plt.gca().add_artist(circle)
+    circle = Circle((xc, yc), r, color='k', fill=False, linewidth=2, label='Fitted Circle')
+    ax.add_artist(circle)
 
     # Plot original data
-    plt.plot(x, y, 'bo-', label='Data Points', markersize=5)
-    plt.plot(x[0], y[0], 'go', label='Start Point', markersize=5)  # First point (green)
-    plt.plot(x[-1], y[-1], 'ro', label='End Point', markersize=5)  # Last point (red)
-    plt.plot(xc, yc, 'ko', label=f'Circle Center (Radius={r:.6f})', markersize=5)  # Circle center (black)
+    ax.plot(x, y, 'bo-', label='Data Points', markersize=5)
+    ax.plot(x[0], y[0], 'go', label='Start Point', markersize=5)  # First point (green)
+    ax.plot(x[-1], y[-1], 'ro', label='End Point', markersize=5)  # Last point (red)
+    ax.plot(xc, yc, 'ko', label=f'Circle Center (Radius={r:.6f})', markersize=5)  # Circle center (black)
+
+    # Zoom to the fitted circle
+    ax.set_xlim((xc - r*1.1), (xc + r*1.1))
+    ax.set_ylim((yc - r*1.1), (yc + r*1.1))
+    ax.set_aspect('equal', adjustable='box')
 
     # Annotate labels
-    txts = []
+    labels = []
     label_indices = np.array([theta_n_index, theta_l_index, theta_h_index])
     for i in label_indices:
         if i == theta_n_index:
-            txt = plt.text(x[i], y[i]*0.65, f"{z[i]:.2f} Hz", color='k', size=30) # text for coordinates and frequency of data point
+            labels.append((x[i], y[i], f"{z[i]:.2f} Hz", {'color': 'k', 'size': 30})) # text for coordinates and frequency of data point
         else:
-            txt = plt.text(x[i], y[i]*0.65, f"Half-power frequency = {z[i]:.2f} Hz", color='k')
-        txts.append(txt)
+            labels.append((x[i], y[i], f"Half-power frequency = {z[i]:.2f} Hz", {'color': 'k'}))
 
-    adjust_text(txts, target_x=x[label_indices], target_y=y[label_indices], arrowprops=dict(arrowstyle="->", color='black', lw=3))
+    fg.place_labels(ax, labels, arrowprops=dict(arrowstyle="->", color='black', lw=3))
 
     # # Labels & Title
     # plt.xlabel('Real')
@@ -341,7 +347,6 @@ async def plot_bode(data: pd.DataFrame, options: dict, plot_type: str = 'Mobilit
     """
 
     accelerometers = options['accelerometers']
-    sample_rate = options['samplingFreq']
 
     # Filter for desired frequency range
     f_min=max(options['lowerCutoff'], 10)
@@ -349,103 +354,70 @@ async def plot_bode(data: pd.DataFrame, options: dict, plot_type: str = 'Mobilit
 
     f_ns = []
 
-    for acc in accelerometers.keys():
-        if accelerometers[acc]:
-            # Compute FFT and Frequency Response Function
-            n = len(data[acc])
-            f = np.fft.fftfreq(n, 1/sample_rate)[:n//2]  # Positive frequencies
-            # print((max(f)-min(f))/len(f))
-            fftacc = np.fft.fft(data[acc])[:n//2]
-            fftforce = np.fft.fft(data['F' + acc[1]])[:n//2]
-
-            # Avoid division by zero
-            fftforce[np.abs(fftforce) < 1e-10] = np.finfo(float).eps
-            frf = fftacc / fftforce  # Intertance Frequency Response Function
-            
-            # Adjust the frf depending on desired plot type
-            if plot_type == 'Mobility':
-                frf_mobility = frf/(1j*f*2*np.pi)  # Convert inertance to mobility
-                frf = frf_mobility
-            elif plot_type == 'Receptance':
-                frf_receptance = frf/-((f*2*np.pi)**2)  # Convert inertance to receptance
-                frf = frf_receptance
-
-            # Compute magnitude and phase
-            magnitude = 20 * np.log10(np.abs(frf))  # Convert to dB
-            phase = np.angle(frf)
-
-            valid_idx = (f >= f_min) & (f <= f_max)
-            f_filtered = f[valid_idx]
-            magnitude_filtered = magnitude[valid_idx]
-            phase_filtered = phase[valid_idx]
+    plot_path = f'./images/{u.format_plot_name(options, "bode")}'
+
+    with fg.acquire('bode') as figure:
+        ax_gain, ax_phase = figure['axes']
+        active = []
+        peak_labels = []
+        half_power_labels = []
+
+        for acc in accelerometers.keys():
+            if not accelerometers[acc]:
+                continue
+
+            # Gain, phase and half-power points of this accelerometer (shared with every other selection)
+            layer = l.bode(data, options, acc, plot_type, f_min, f_max)
+            f_filtered = layer['f']
+            magnitude_filtered = layer['gain']
+            phase_filtered = layer['phase']
+
+            # Magnitude Plot
+            line = figure['lines']['gain'][acc]
+            line.set_data(f_filtered, magnitude_filtered)
+            line.set_visible(True)
+
+            # Phase Plot
+            line = figure['lines']['phase'][acc]
+            line.set_data(f_filtered, phase_filtered)
+            line.set_visible(True)
+            active.append(line)
+
+            # Nothing to annotate if the band is empty
+            idx_peak = layer['peak']
+            if idx_peak is None:
+                continue
 
             # Find peak magnitude and corresponding frequency
-            peak_mag = np.max(magnitude_filtered)
-            # print(peak_mag)
-            idx_peak = np.argmax(magnitude_filtered)
+            peak_mag = magnitude_filtered[idx_peak]
             f_n = f_filtered[idx_peak]
             f_ns.append(f_n)
 
-            # Find Half-Power (-3 dB) Magnitude
-            half_power_mag = peak_mag - 3  # -3 dB point
+            # Half-power frequency to the left of peak where magnitude drops to -3 dB
+            f1 = layer['f1']
+            if f1 is not None:
+                half_power_labels.append((f1, peak_mag - 3, f'f1: {f1:.2f} Hz', {'color': 'black'}))
+                ax_gain.axvline(f1, color='black', linestyle='--')  # Vertical line at f1
 
-            # Magnitude Plot
-            plt.subplot(2, 1, 1)
-            # plt.title(f'{plot_type} Bode plot')
-            plt.plot(f_filtered, magnitude_filtered, label=acc)
-            plt.ylabel('Gain [dB]')
-            plt.grid(True, which="both")
-
-            text_objects = []
-            
-            # Find first index to the left of peak where magnitude drops to or below -3 dB
-            # Search backwards from the peak index
-            try:
-                idx_f1 = np.where(magnitude_filtered[:idx_peak] <= half_power_mag)[0][-1]  # First index to the left
-            except IndexError:
-                pass
-            else:
-                f1 = f_filtered[idx_f1]
-                text_objects.append(plt.text(f1, magnitude_filtered[idx_f1]+2, f'f1: {f1:.2f} Hz', color='black', verticalalignment='bottom', horizontalalignment='center'))
-                plt.axvline(f1, color='black', linestyle='--')  # Vertical line at f1
-
-            # Find first index to the right of peak where magnitude drops to or below -3 dB
-            # Search forwards from the peak index
-            try:
-                idx_f2 = np.where(magnitude_filtered[idx_peak:] <= half_power_mag)[0][0] + idx_peak  # First index to the right
-            except IndexError:
-                pass
-            else:
-                f2 = f_filtered[idx_f2]
-                text_objects.append(plt.text(f2, magnitude_filtered[idx_f2]-5, f'f2: {f2:.2f} Hz', color='black', verticalalignment='bottom', horizontalalignment='center'))
-                plt.axvline(f2, color='black', linestyle='--')  # Vertical line at f2
-
-            # Annotate Bode Plot with vertical lines 
-            plt.axvline(f_n, color='red', linestyle='--')  # Vertical line at peak frequency
-            # plt.text(f_n, peak_mag+2, f'Peak: {f_n:.2f} Hz', color='red', fontsize=8, verticalalignment='bottom', horizontalalignment='center', bbox=dict(facecolor='white', edgecolor='red', boxstyle='round4', pad=0.5))
-            # plt.text(f1, magnitude_filtered[idx_f1]+2, f'f1: {f1:.2f} Hz', color='blue', fontsize=8, verticalalignment='bottom', horizontalalignment='center', bbox=dict(facecolor='white', edgecolor='blue', boxstyle='round4', pad=0.5))
-            # plt.text(f2, magnitude_filtered[idx_f2]+2, f'f2: {f2:.2f} Hz', color='blue', fontsize=8, verticalalignment='bottom', horizontalalignment='center', bbox=dict(facecolor='white', edgecolor='blue', boxstyle='round4', pad=0.5))
-             
-            # Text labels
-            text_objects.append(plt.text(f_n, peak_mag+2, f'Peak: {f_n:.2f} Hz', color='red', verticalalignment='bottom', horizontalalignment='center'))
+            # Half-power frequency to the right of peak where magnitude drops to -3 dB
+            f2 = layer['f2']
+            if f2 is not None:
+                half_power_labels.append((f2, peak_mag - 3, f'f2: {f2:.2f} Hz', {'color': 'black'}))
+                ax_gain.axvline(f2, color='black', linestyle='--')  # Vertical line at f2
 
-            # Use adjustText to automatically adjust text positions to avoid overlap
-            adjust_text(text_objects) #arrowprops=dict(arrowstyle="->", color='grey', lw=1))
-            # only_move={'points', 'text'}, arrowprops=dict(arrowstyle="->", color='gray', lw=0.5))
+            # Annotate Bode Plot with vertical lines
+            ax_gain.axvline(f_n, color='red', linestyle='--')  # Vertical line at peak frequency
 
-            # Phase Plot
-            plt.subplot(2, 1, 2)
-            plt.plot(f_filtered, phase_filtered, label=acc)
-            plt.xlabel('Frequency [Hz]')
-            plt.ylabel('Phase [rad]')
-            plt.grid(True, which="both")
+            # Text labels
+            peak_labels.append((f_n, peak_mag, f'Peak: {f_n:.2f} Hz', {'color': 'red'}))
 
-    # plt.legend()
-    plot_path = f'./images/{u.format_accel_plot_name(options, "bode")}'
-    plt.legend()
-    plt.savefig(plot_path, bbox_inches='tight')
-    # plt.show()
-    plt.close()
+        # Place labels in fixed slots around their points (peaks first) once the gain axes are scaled
+        fg.autoscale(ax_gain)
+        fg.place_labels(ax_gain, peak_labels + half_power_labels)
+
+        fg.autoscale(ax_phase)
+        ax_phase.legend(handles=active)
+        save_plot(figure['figure'], plot_path, options, "bode", bbox_inches='tight')
 
     return plot_path, f_ns
 
@@ -459,16 +431,10 @@ def frf_matrix(data: pd.DataFrame, options: dict):
     for i, shaker_pos in enumerate([0, 2, 4]):
         options['shakerPosition'] = shaker_pos
         data = r.read_csv(options)
-        for j, acc in enumerate(['A0', 'A2', 'A4']):
-            # Compute FFT and Frequency Response Function
-            n = len(data[acc])
-            f = np.fft.fftfreq(n, 1/options['samplingFreq'])[:n//2]  # Positive frequencies
-            fftacc = np.fft.fft(data[acc])[:n//2]
-            fftforce = np.fft.fft(data['F' + acc[1]])[:n//2]
-
-            # Avoid division by zero
-            fftforce[np.abs(fftforce) < 1e-10] = np.finfo(float).eps
-            frf = fftacc / fftforce  # Frequency Response Function)
+        spectrum = s.get_spectrum(data, options)
+        f = spectrum['f']
+        frfs = spectrum['inertance'][s.channel_rows(['A0', 'A2', 'A4'])]  # Frequency Response Functions
+        for j, (acc, frf) in enumerate(zip(['A0', 'A2', 'A4'], frfs)):
 
             ax = axes[j,i]
             ax.plot(f, frf.imag)
@@ -515,53 +481,27 @@ async def plot_imaginary_r(data: pd.DataFrame, options: dict) -> None:
     """
 
     accelerometers = options['accelerometers']
-    sample_rate = options['samplingFreq']
 
     f_min = options['lowerCutoff']
     f_max = options['upperCutoff']
 
-    # frf_i = []
-    # frf_abs = []
-
-    # im_values = []
-    abs_values = []
-    phase_values = []
-
-    for acc in accelerometers.keys():
-        if accelerometers[acc]:
-            # Compute FFT and Frequency Response Function
-            n = len(data[acc])
-            f = np.fft.fftfreq(n, 1/sample_rate)[:n//2]  # Positive frequencies
-            fftacc = np.fft.fft(data[acc])[:n//2]
-            fftforce = np.fft.fft(data['F' + acc[1]])[:n//2]
-
-            # Avoid division by zero
-            fftforce[np.abs(fftforce) < 1e-10] = np.finfo(float).eps
-            frf = fftacc / fftforce  # Frequency Response Function
-
-            # Remove frequencies outside the desired range
-            valid_idx = (f >= f_min) & (f <= f_max)
-            f = f[valid_idx]
-            frf = frf[valid_idx]
-    
-            # Convert inertance to receptance
-            omega = 2 * np.pi * f  # Convert frequency to angular frequency (rad/s)
-            omega[np.abs(omega) < 1e-10] = np.finfo(float).eps
-            frf_r = frf / (-omega**2)  # Convert inertance to receptance
+    spectrum = s.get_frfs(data, options)
+    valid_idx = u.band(spectrum['f'], f_min, f_max)  # Remove frequencies outside the desired range
 
-            # Get gain and imag component
-            frf_abs = np.abs(frf_r)
-            frf_phase = np.angle(frf_r)
-            # frf_img = np.imag(frf_r)
+    # Receptance Frequency Response Functions of the selected accelerometers
+    frf_r = spectrum['receptance'][s.channel_rows(accelerometers)][:, valid_idx]
 
-            # Find peak magnitude and corresponding frequency
-            idx_peak = np.argmax(frf_abs)
-            # im_values.append(frf_img[idx_peak])
-            abs_values.append(frf_abs[idx_peak])
-            phase_values.append(frf_phase[idx_peak])
-
-            # frf_i.append(frf_img)
-            # frf_abs.append(abs_frf)
+    # Find peak magnitude of each accelerometer and the gain and phase at that peak
+    if frf_r.shape[1] > 0:
+        frf_abs = np.abs(frf_r)
+        idx_peaks = np.argmax(frf_abs, axis=1)
+        rows = np.arange(len(idx_peaks))
+        abs_values = frf_abs[rows, idx_peaks]
+        phase_values = np.angle(frf_r[rows, idx_peaks])
+    else:
+        # An empty or inverted band has no peaks, so nothing is plotted
+        abs_values = np.full(len(frf_r), np.nan)
+        phase_values = np.zeros(len(frf_r))
 
     # # Convert to NumPy arrays for easier processing
     # frf_i = np.array(frf_i)
@@ -654,23 +594,30 @@ async def plot_imaginary_r(data: pd.DataFrame, options: dict) -> None:
         else:
             plot_phase.append(-1)
     
-    # Plot the imaginary part of FRF for the current peak
-    plt.scatter(active_x_locations, abs_values*plot_phase, color='red', s=10)
+    plot_path = f'./images/{u.format_plot_name(options, "mode-shapes")}'
+
+    with fg.acquire('mode-shapes') as figure:
+        ax, = figure['axes']
 
-    # Add vertical lines from the x-axis to each point
-    for loc, val in zip(active_x_locations, abs_values*plot_phase):
-        if not np.isnan(val):  # Skip NaN values
-            plt.plot([loc, loc], [0, val], color='blue', linestyle='--', linewidth=1)
+        # Accelerometer locations are evenly spaced categories
+        x_positions = np.arange(len(active_x_locations))
 
-    # Center the graph around the x-axis
-    plt.xticks(active_x_locations)
-    plt.axhline(0, color='black', linewidth=0.5)
-    plt.xlabel('Accelerometer location')
-    plt.ylabel('Normalised Abs(Receptance FRF)')
+        # Plot the imaginary part of FRF for the current peak
+        ax.plot(x_positions, abs_values*plot_phase, 'o', color='red', markersize=np.sqrt(10))
+
+        # Add vertical lines from the x-axis to each point
+        for loc, val in zip(x_positions, abs_values*plot_phase):
+            if not np.isnan(val):  # Skip NaN values
+                ax.plot([loc, loc], [0, val], color='blue', linestyle='--', linewidth=1)
+
+        ax.set_xticks(x_positions, active_x_locations)
+        ax.set_xlim(-0.5, len(active_x_locations) - 0.5)
+        if np.any(np.isfinite(abs_values)):
+            fg.autoscale(ax)
+        else:
+            ax.set_ylim(-1, 1)  # Range of the normalised values
 
-    plot_path = f'./images/{u.format_accel_plot_name(options, "mode-shapes")}'
-    plt.savefig(plot_path, bbox_inches='tight', pad_inches=0.5)
-    plt.close()
+        save_plot(figure['figure'], plot_path, options, "mode-shapes", bbox_inches='tight', pad_inches=0.5)
 
     return plot_path
 
@@ -697,42 +644,12 @@ async def plot_argand_r(data: pd.DataFrame, options: dict) -> None:
     """
     
     accelerometers = options['accelerometers']
-    # sample_rate = options['samplingFreq']
-
-    frf_ar = []
-    frf_abs = []
-
-    for acc in accelerometers.keys():
-        if accelerometers[acc]:
-            # Compute FFT and Frequency Response Function
-            n = len(data[acc])
-            freqs = np.fft.fftfreq(n, 1/options['samplingFreq'])[:n//2]  # Positive frequencies
-            fftacc = np.fft.fft(data[acc])[:n//2]
-            fftforce = np.fft.fft(data['F' + acc[1]])[:n//2]
-
-            # Avoid division by zero
-            fftforce[np.abs(fftforce) < 1e-10] = np.finfo(float).eps
-            frf = fftacc / fftforce  # Frequency Response Function
-            # frfs.append(frf)
-    
-            freqs = f
-            # Convert inertance to receptance
-            omega = 2 * np.pi * freqs  # Convert frequency to angular frequency (rad/s)
-            frf_r = frf / (-omega**2)  # Convert inertance to receptance
-    
-            # Avoid division by zero at zero frequency
-            frf_r[omega == 0] = np.inf
-
-            abs_frf = np.abs(frf_r)
-
-            frf_ar.append(frf_r)
-            frf_abs.append(abs_frf)
 
     active_accelerometers = [key for key, value in accelerometers.items() if value]
 
-
-    frf_ar = np.array(frf_ar)
-    frf_abs = np.array(frf_abs)
+    spectrum = s.get_spectrum(data, options)
+    frf_ar = spectrum['receptance'][s.channel_rows(active_accelerometers)]  # Receptance Frequency Response Functions
+    frf_abs = np.abs(frf_ar)
 
     if frf_ar.ndim == 1:
         # If frf_ar is 1D, treat it as a single row
@@ -773,7 +690,7 @@ async def plot_argand_r(data: pd.DataFrame, options: dict) -> None:
     fig_height = base_fig_height_per_peak * num_peaks
 
     # Create a vertical subplot based on the number of peaks
-    fig, axs = plt.subplots(nrows=num_peaks, ncols=1, figsize=(fig_width, fig_height), sharex=True, sharey=True)
+    fig, axs = fg.new_figure(nrows=num_peaks, ncols=1, figsize=(fig_width, fig_height), sharex=True, sharey=True)
 
     # If there's only one peak, axs will not be an array, so we convert it to a list for consistency
     if num_peaks == 1:
@@ -818,11 +735,10 @@ async def plot_argand_r(data: pd.DataFrame, options: dict) -> None:
         # Add a common title for all subplots with a custom font size
         fig.suptitle('Trigonometric Functions', fontsize=16)
 
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
 
-    plot_path = f'./images/{u.format_accel_plot_name(options, "argand")}'
-    plt.savefig(plot_path, bbox_inches='tight', pad_inches=0.5)
+    plot_path = f'./images/{u.format_plot_name(options, "argand")}'
+    save_plot(fig, plot_path, options, "argand", bbox_inches='tight', pad_inches=0.5)
     
     return plot_path
 
@@ -830,7 +746,6 @@ async def plot_argand_r(data: pd.DataFrame, options: dict) -> None:
 if __name__ == '__main__':
     import json
     import asyncio
-    import reader as r
     with open('./templates/requestFormat.json') as f:
         options = json.load(f)
     data = r.read_csv(options)
@@ -1,7 +1,83 @@
+from fractions import Fraction
+from scipy.signal import resample_poly
 import pandas as pd
 import numpy as np
 import utils as u
-import math
+import store
+import os
+
+
+# Sampling frequency that the recordings are assumed to be taken at
+NOMINAL_SAMPLING_FREQ = 2048
+
+# Version of the resampled copies kept on disk, increased whenever resample changes so that old copies are rebuilt
+RESAMPLE_VERSION = 2
+
+# Maximum number of bytes of decoded recordings held in memory
+CACHE_BYTES = int(os.environ.get('DATASET_CACHE_BYTES', 128 * 1024**2))
+
+# Entries are weighed by the size of their columns, so CACHE_BYTES bounds the memory used rather than the count
+_cache = u.LRU(CACHE_BYTES, lambda values: values.nbytes)
+
+
+def clear_cache():
+
+    """Empty the dataset cache."""
+
+    _cache.clear()
+
+
+def resample(values: np.ndarray, sampling_freq: float) -> np.ndarray:
+
+    """
+    Resample a recording to a lower sampling frequency.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Columns of the recording (one row per column) with time in the first row.
+    sampling_freq : float
+        The target sampling frequency. It does not need to divide the nominal sampling frequency.
+
+    Returns
+    -------
+    np.ndarray
+        Columns of the resampled recording (one row per column).
+    """
+
+    ratio = Fraction(sampling_freq / NOMINAL_SAMPLING_FREQ).limit_denominator(1000)
+    up, down = ratio.numerator, ratio.denominator
+
+    # Polyphase filtering removes content above the new Nyquist frequency before decimating
+    signals = resample_poly(values[1:], up, down, axis=1)
+
+    # Rebuild the time axis at the new sample spacing, from the mean spacing of the recording (the first interval is
+    # often shorter than the rest)
+    dt = (values[0, -1] - values[0, 0]) / (values.shape[1] - 1) * down / up
+    t = values[0, 0] + np.arange(signals.shape[1]) * dt
+
+    return np.vstack([t, signals])
+
+
+def load_values(csv_path: str, sampling_freq: float) -> np.ndarray:
+
+    """Load the columns of a recording (one row per column) at the requested sampling frequency."""
+
+    # Adjust the sampling frequency if necessary
+    if sampling_freq < NOMINAL_SAMPLING_FREQ:
+        return store.load_variant(csv_path, f'{sampling_freq:g}Hz_v{RESAMPLE_VERSION}', lambda values: resample(values, sampling_freq))
+
+    return store.load(csv_path)
+
+
+def load_columns(csv_path: str, sampling_freq: float) -> np.ndarray:
+
+    """Load the columns of a recording as a read-only array, so that callers cannot corrupt cached entries."""
+
+    values = load_values(csv_path, sampling_freq)
+    values.flags.writeable = False
+
+    return values
 
 
 def read_csv(options: dict, is_sim: bool = False):
@@ -9,10 +85,7 @@ def read_csv(options: dict, is_sim: bool = False):
     """Reads csv file and returns a pandas dataframe."""
 
     # Make sure that free vibration reads hammer testing data
-    if options['excitationType'] == 'Free vibration':
-        options['excitationType'] = 'Soft'
-    elif options['excitationType'] == 'Hammer testing':
-        options['excitationType'] = options['tipHardness']
+    options['excitationType'] = u.resolve_excitation(options)
 
     # Because recorded data is symetric we can use data recorded at 0 as l and l/4 as 3l/4
     columns = ['t', 'F0', 'A0', 'F1', 'A1', 'F2', 'A2', 'F3', 'A3', 'F4', 'A4']
@@ -23,15 +96,20 @@ def read_csv(options: dict, is_sim: bool = False):
 
     filename = u.format_filename(options, mirror_shaker_position)
     if is_sim:
-        df = pd.read_csv(f'../../fe/sim_data/{filename}.csv', header=0, names=columns)  # Read from simulation data
+        csv_path = f'../../fe/sim_data/{filename}.csv'  # Read from simulation data
     else:
-        df = pd.read_csv(f'./data/{filename}.csv', header=0, names=columns)  # Read from experimental data
+        csv_path = f'./data/{filename}.csv'  # Read from experimental data
 
-    # Adjust the sampling frequency if necessary
-    if options['samplingFreq'] < 2048:
-        sample_interval = math.floor(2048/options['samplingFreq'])
-        print(sample_interval)
-        df = df.iloc[::sample_interval,:]
+    # Reuse the decoded recording if this version of it has already been read at this sampling frequency
+    signature = tuple(store.source_signature(csv_path).values())
+    key = (os.path.realpath(csv_path), signature, mirror_shaker_position, options['samplingFreq'])
+    values = _cache.get(key, lambda: load_columns(csv_path, options['samplingFreq']))
+
+    # Wrap the cached columns in a new dataframe without copying them
+    df = pd.DataFrame(values.T, columns=columns, copy=False)
+
+    # Record which version of the recording this is, so that results derived from it are cached per version
+    df.attrs['signature'] = signature
 
     # # Normalise the data to have zero mean
     # for accel_index in range(5):
@@ -0,0 +1,136 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import asyncio
+import inspect
+import os
+
+"""
+This module runs plot rendering in a pool of worker processes so that slow renders do not block the API."""
+
+
+# Number of worker processes used for rendering
+WORKERS = int(os.environ.get('RENDER_WORKERS', 2))
+
+_executor = None
+
+# Renders that are currently running, keyed by plot filename
+_in_flight = {}
+
+
+def init_worker():
+
+    """Prepare a worker process for rendering."""
+
+    import matplotlib
+    matplotlib.use('Agg')  # Render to files only
+
+
+def get_executor() -> ProcessPoolExecutor:
+
+    """Return the render pool, starting it on first use."""
+
+    global _executor
+
+    if _executor is None:
+        # Spawn fresh processes rather than forking the running event loop
+        _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'), initializer=init_worker)
+
+    return _executor
+
+
+def run_plot(func, options: dict, *args):
+
+    """Read the requested data and call a plotting function. This runs inside a worker process."""
+
+    import reader as r
+
+    data = r.read_csv(options)
+    result = func(data, options, *args)
+
+    # Plotting functions are coroutines so they must be driven to completion here
+    if inspect.iscoroutine(result):
+        result = asyncio.run(result)
+
+    return result
+
+
+async def render(func, options: dict, *args):
+
+    """
+    Render a plot in the worker pool without blocking the event loop.
+
+    Parameters
+    ----------
+    func : callable
+        Plotting function that takes the data and the options (e.g. plotter.plot_bode).
+    options : dict
+        Dictionary of options sent with the request.
+    *args
+        Any additional arguments passed to the plotting function.
+
+    Returns
+    -------
+    Any
+        The value returned by the plotting function (usually the file path of the plot).
+    """
+
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(get_executor(), run_plot, func, options, *args)
+
+
+async def render_once(key: str, func, options: dict, *args, renderer=None):
+
+    """
+    Render a plot, sharing a single render between concurrent requests for the same plot.
+
+    Parameters
+    ----------
+    key : str
+        Identifier of the plot, i.e. its filename.
+    func : callable
+        Plotting function that takes the data and the options (e.g. plotter.plot_bode).
+    options : dict
+        Dictionary of options sent with the request.
+    *args
+        Any additional arguments passed to the plotting function.
+    renderer : callable, optional
+        Coroutine that schedules the render, e.g. one that splits it across several workers. Defaults to render.
+
+    Returns
+    -------
+    Any
+        The value returned by the plotting function (usually the file path of the plot).
+    """
+
+    task = _in_flight.get(key)
+
+    if task is None:
+        task = asyncio.ensure_future((renderer or render)(func, options, *args))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+
+    # Shield the render so that one client disconnecting does not cancel it for everyone else
+    return await asyncio.shield(task)
+
+
+def recycle():
+
+    """Replace the worker processes with fresh ones (whose caches are empty), letting queued renders finish first."""
+
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def shutdown():
+
+    """Stop the worker processes."""
+
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
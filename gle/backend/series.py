@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import struct
+import json
+import spectral as s
+import downsample as ds
+import layers as l
+import utils as u
+
+"""
+This module builds the data behind each plot so that the frontend can draw the plots itself."""
+
+
+# Approximate maximum number of points returned for each series
+MAX_POINTS = 2000
+
+# Default number of frames returned for client-side animations
+ANIMATION_FRAMES = 240
+
+
+def time_domain(data: pd.DataFrame, options: dict) -> dict:
+
+    """
+    Build the acceleration time series of the selected accelerometers.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the acceleration data and corresponding time data.
+    options : dict
+        Dictionary containing the following keys:
+            - 'accelerometers': A dictionary where keys are accelerometer names and values are booleans indicating
+                                whether to include that accelerometer.
+            - 'downsample': Optional. 'lttb' to use Largest-Triangle-Three-Buckets instead of min/max bucketing.
+
+    Returns
+    -------
+    dict
+        Dictionary of 1-D arrays: the time axis 't' and one trace per selected accelerometer.
+    """
+
+    accelerometers = options['accelerometers']
+    active = [acc for acc in accelerometers.keys() if accelerometers[acc]]
+
+    t = data['t'].to_numpy()
+    traces = data[active].to_numpy().T
+
+    return reduce(t, 't', active, traces, options.get('downsample'))
+
+
+def dft(data: pd.DataFrame, options: dict) -> dict:
+
+    """Build the amplitude spectra of the selected accelerometers (up to 1000 Hz, as in the DFT plot)."""
+
+    accelerometers = options['accelerometers']
+    active = [acc for acc in accelerometers.keys() if accelerometers[acc]]
+
+    spectrum = s.get_spectrum(data, options)
+    valid_idx = u.band(spectrum['f'], f_max=1000)
+    ffts = np.abs(spectrum['accel'][s.channel_rows(active)][:, valid_idx])
+
+    return reduce(spectrum['f'][valid_idx], 'f', active, ffts, options.get('downsample'))
+
+
+def reduce(x: np.ndarray, x_name: str, names: list, traces: np.ndarray, method: str = None) -> dict:
+
+    """Downsample traces that share an x axis to about MAX_POINTS points, keeping the same x values for every trace."""
+
+    if len(names) == 0:
+        return {x_name: x}
+
+    if method == 'lttb':
+        indices = np.unique(np.concatenate([ds.lttb_indices(x, y, MAX_POINTS // len(names)) for y in traces]))
+    else:
+        # The minimum and maximum of each bucket are kept for every trace
+        indices = ds.minmax_indices(traces, max(1, MAX_POINTS // (2*len(names))))
+
+    series = {x_name: x[indices]}
+    for name, y in zip(names, traces):
+        series[name] = y[indices]
+
+    return series
+
+
+def bode(data: pd.DataFrame, options: dict, plot_type: str = 'Mobility') -> dict:
+
+    """Build the FRF gain (dB), phase (rad) and, with the H1/H2 estimators, coherence of the selected accelerometers in the band."""
+
+    accelerometers = options['accelerometers']
+    active = [acc for acc in accelerometers.keys() if accelerometers[acc]]
+
+    # Filter for desired frequency range
+    f_min = max(options['lowerCutoff'], 10)
+    f_max = min(options['upperCutoff'], 1000)
+
+    series = {}
+    for acc in active:
+        # Reuse the layers drawn by the Bode plot
+        layer = l.bode(data, options, acc, plot_type, f_min, f_max)
+        series['f'] = layer['f']
+        series[f'{acc}_gain'] = layer['gain']
+        series[f'{acc}_phase'] = layer['phase']
+        if 'coherence' in layer:
+            series[f'{acc}_coherence'] = layer['coherence']
+
+    return series
+
+
+def displacement(data: pd.DataFrame, options: dict) -> dict:
+
+    """
+    Build the nodal displacements of the beam for the frontend to animate.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the acceleration data and corresponding time data.
+    options : dict
+        Dictionary containing the following keys:
+            - 'frames': Optional. Number of frames (defaults to ANIMATION_FRAMES).
+
+    Returns
+    -------
+    dict
+        Dictionary of 1-D arrays: the time of each frame 't' and the displacement of each node (A0 to A4) in each frame.
+    """
+
+    disp, _ = u.accel_to_disp(data, options)
+
+    # Evenly spaced frames, as in the server-rendered animation
+    frames = int(min(max(options.get('frames', ANIMATION_FRAMES), 1), len(disp)))
+    steps = np.arange(frames) * (len(disp) // frames)
+
+    return {name: disp[name].to_numpy()[steps] for name in disp.columns}
+
+
+def to_json(series: dict) -> dict:
+
+    """Convert a series to JSON-friendly lists, keeping six significant figures."""
+
+    return {name: [float(f'{value:.6g}') for value in values] for name, values in series.items()}
+
+
+def to_float32(series: dict) -> bytes:
+
+    """
+    Pack a series into a compact binary payload.
+
+    The payload starts with the length of a JSON header as a little-endian uint32, followed by the header itself
+    ({"names": [...], "lengths": [...]}), padding to a multiple of 4 bytes and then each array as little-endian
+    float32 values in the order given by the header.
+    """
+
+    header = json.dumps({
+        'names': list(series.keys()),
+        'lengths': [len(values) for values in series.values()],
+    }).encode()
+    header += b' ' * (-(4 + len(header)) % 4)  # Align the arrays to 4 bytes
+
+    body = b''.join(np.asarray(values, dtype='<f4').tobytes() for values in series.values())
+
+    return struct.pack('<I', len(header)) + header + body
@@ -0,0 +1,271 @@
+from scipy.fft import rfft
+from scipy.signal import get_window, ZoomFFT
+from numpy.lib.stride_tricks import sliding_window_view
+import numpy as np
+import pandas as pd
+import os
+import utils as u
+
+"""
+This module computes the spectra and frequency response functions of a dataset once so that every plotter and
+analyser can share them. FRFs are either the ratio of the spectra of the whole record or, on request, H1/H2
+estimates averaged over windowed, overlapping segments (Welch's method). Either can be evaluated on a dense grid
+within the requested band only (a zoom FFT) instead of on every bin up to the Nyquist frequency."""
+
+
+# Maximum number of spectrum bundles held in memory
+CACHE_SIZE = int(os.environ.get('SPECTRUM_CACHE_SIZE', 32))
+
+ACCELEROMETERS = ['A0', 'A1', 'A2', 'A3', 'A4']
+FORCES = ['F0', 'F1', 'F2', 'F3', 'F4']
+
+_cache = u.LRU(CACHE_SIZE)
+
+
+def transform(signals: np.ndarray, sample_rate: float, band: tuple = None, points: int = None) -> tuple:
+
+    """
+    Transform signals along their last axis, either on every positive bin or on a grid within a band.
+
+    Parameters
+    ----------
+    signals : np.ndarray
+        Signals with time along the last axis.
+    sample_rate : float
+        The sampling frequency of the signals.
+    band : tuple, optional
+        Lowest and highest frequency to evaluate, clamped to lie between 0 Hz and the Nyquist frequency. If None (or
+        if nothing of the band is left), every bin below the Nyquist frequency is returned.
+    points : int, optional
+        Number of evenly spaced frequencies within the band (both ends included).
+
+    Returns
+    -------
+    tuple
+        The frequency axis and the spectra.
+    """
+
+    n = signals.shape[-1]
+
+    # Frequencies above the Nyquist frequency would only show a mirror image of the ones below it
+    if band is not None:
+        band = (max(band[0], 0), min(band[1], sample_rate / 2))
+
+    if band is None or not band[0] < band[1]:
+        f = np.fft.rfftfreq(n, 1/sample_rate)[:n//2]  # Positive frequencies
+        return f, rfft(signals, axis=-1, workers=-1)[..., :n//2]
+
+    # Chirp-z transform of the band only, much cheaper than zero-padding the whole transform to the same spacing
+    zoom = ZoomFFT(n, band, points, fs=sample_rate, endpoint=True)
+
+    return np.linspace(band[0], band[1], points), zoom(signals, axis=-1)
+
+
+def compute_spectrum(data: pd.DataFrame, sample_rate: float, band: tuple = None, points: int = None) -> dict:
+
+    """
+    Compute the spectrum bundle of a dataset.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the acceleration data and corresponding force data.
+    sample_rate : float
+        The sampling frequency of the data.
+    band : tuple, optional
+        Lowest and highest frequency to evaluate (see transform). Every positive bin by default.
+    points : int, optional
+        Number of frequencies within the band.
+
+    Returns
+    -------
+    dict
+        Dictionary containing the following keys:
+            - 'f': The positive frequency axis (or the grid within the band).
+            - 'sampleRate': The sampling frequency used to build the frequency axis.
+            - 'accel': Acceleration spectra with one row per accelerometer (A0 to A4).
+            - 'force': Force spectra with one row per force channel (F0 to F4).
+            - 'inertance', 'mobility', 'receptance': FRFs with one row per accelerometer.
+    """
+
+    # Stack every channel into one contiguous array and transform them all in a single call
+    signals = np.ascontiguousarray(data[FORCES + ACCELEROMETERS].to_numpy(dtype=float).T)
+    f, spectra = transform(signals, sample_rate, band, points)
+    fftforce = spectra[:5]
+    fftacc = spectra[5:]
+
+    # Avoid division by zero
+    fftforce_safe = np.where(np.abs(fftforce) < 1e-10, np.finfo(float).eps, fftforce)
+    frf = fftacc / fftforce_safe  # Inertance Frequency Response Function
+
+    return {
+        'f': f,
+        'sampleRate': sample_rate,
+        'accel': fftacc,
+        'force': fftforce,
+        **frf_types(f, frf),
+    }
+
+
+def frf_types(f: np.ndarray, frf: np.ndarray) -> dict:
+
+    """Return an inertance FRF along with the mobility and receptance derived from it."""
+
+    # Convert frequency to angular frequency (rad/s) and avoid division by zero at 0 Hz
+    omega = 2 * np.pi * f
+    omega[np.abs(omega) < 1e-10] = np.finfo(float).eps
+
+    return {
+        'inertance': frf,
+        'mobility': frf / (1j*omega),  # Convert inertance to mobility
+        'receptance': frf / -(omega**2),  # Convert inertance to receptance
+    }
+
+
+def compute_averaged_frf(data: pd.DataFrame, sample_rate: float, estimator: str, segment_length: int, overlap: float,
+                         band: tuple = None, points: int = None) -> dict:
+
+    """
+    Estimate the FRFs of a dataset from cross and auto power spectra averaged over windowed, overlapping segments.
+
+    H1 = Gfa/Gff is unbiased by noise on the acceleration and H2 = Gaa/Gaf by noise on the force. The coherence
+    Gfa^2/(Gff*Gaa) is close to 1 where the acceleration is explained by the force.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the acceleration data and corresponding force data.
+    sample_rate : float
+        The sampling frequency of the data.
+    estimator : str
+        'H1' or 'H2'.
+    segment_length : int
+        Number of samples in each segment (sets the frequency resolution to sample_rate/segment_length).
+    overlap : float
+        Fraction of each segment shared with the next one.
+    band : tuple, optional
+        Lowest and highest frequency to evaluate (see transform). Every positive bin by default.
+    points : int, optional
+        Number of frequencies within the band.
+
+    Returns
+    -------
+    dict
+        Dictionary containing the following keys:
+            - 'f': The positive frequency axis of a segment (or the grid within the band).
+            - 'sampleRate': The sampling frequency used to build the frequency axis.
+            - 'segments': The number of segments averaged.
+            - 'coherence': Coherence between each force channel and its accelerometer.
+            - 'inertance', 'mobility', 'receptance': FRFs with one row per accelerometer.
+    """
+
+    n = min(segment_length, len(data))
+    step = max(n - int(overlap * n), 1)
+
+    # Cut every channel into segments (views, not copies) and transform them all in a single call
+    signals = np.ascontiguousarray(data[FORCES + ACCELEROMETERS].to_numpy(dtype=float).T)
+    segments = sliding_window_view(signals, n, axis=1)[:, ::step]
+    segments = (segments - segments.mean(axis=2, keepdims=True)) * get_window('hann', n)
+    f, spectra = transform(segments, sample_rate, band, points)
+    fftforce = spectra[:5]
+    fftacc = spectra[5:]
+
+    # Average the power spectra over the segments (scaling factors cancel out in the ratios)
+    g_ff = np.mean(np.abs(fftforce)**2, axis=1)
+    g_aa = np.mean(np.abs(fftacc)**2, axis=1)
+    g_fa = np.mean(np.conj(fftforce) * fftacc, axis=1)
+
+    # Avoid division by zero
+    tiny = np.finfo(float).eps
+    g_ff_safe = np.where(g_ff < 1e-20, tiny, g_ff)
+    g_af_safe = np.where(np.abs(g_fa) < 1e-20, tiny, np.conj(g_fa))
+
+    frf = g_fa / g_ff_safe if estimator == 'H1' else g_aa / g_af_safe
+
+    return {
+        'f': f,
+        'sampleRate': sample_rate,
+        'segments': segments.shape[1],
+        'coherence': np.abs(g_fa)**2 / np.maximum(g_ff * g_aa, tiny),
+        **frf_types(f, frf),
+    }
+
+
+def dataset_key(data: pd.DataFrame, options: dict, sample_rate: float = None) -> tuple:
+
+    """
+    Identify the data that a spectrum bundle (or anything derived from it) was computed from.
+
+    The key includes the signature of the recording (see reader.read_csv), so that results computed from an older
+    version of a recording are not reused once it has been replaced.
+    """
+
+    if sample_rate is None:
+        sample_rate = options['samplingFreq']
+
+    return (u.format_filename(options), data.attrs.get('signature'), float(sample_rate), len(data))
+
+
+def get_spectrum(data: pd.DataFrame, options: dict, sample_rate: float = None) -> dict:
+
+    """Return the cached spectrum bundle of a dataset, computing it on first use."""
+
+    if sample_rate is None:
+        sample_rate = options['samplingFreq']
+
+    return _cache.get(dataset_key(data, options, sample_rate), lambda: compute_spectrum(data, sample_rate))
+
+
+def get_frfs(data: pd.DataFrame, options: dict, sample_rate: float = None) -> dict:
+
+    """
+    Return the cached FRF bundle of a dataset with the estimator requested in the options, computing it on first use.
+
+    The default estimator ('single') returns the spectrum bundle itself. 'H1' and 'H2' return a bundle averaged over
+    segments (see compute_averaged_frf), which also contains the coherence. With 'zoom', either is evaluated on a
+    grid within the requested band only.
+    """
+
+    if sample_rate is None:
+        sample_rate = options['samplingFreq']
+
+    settings = u.estimator_settings(options)
+    if settings['estimator'] == 'single' and settings['band'] is None:
+        return get_spectrum(data, options, sample_rate)
+
+    def build():
+        if settings['estimator'] == 'single':
+            return compute_spectrum(data, sample_rate, settings['band'], settings['bandPoints'])
+        return compute_averaged_frf(data, sample_rate, settings['estimator'], settings['segmentLength'], settings['overlap'],
+                                    settings['band'], settings['bandPoints'])
+
+    return _cache.get(dataset_key(data, options, sample_rate) + tuple(settings.values()), build)
+
+
+def channel_rows(accelerometers) -> list:
+
+    """Return the spectrum rows of the given accelerometers (either a list of names or the options dictionary)."""
+
+    if isinstance(accelerometers, dict):
+        accelerometers = [acc for acc in accelerometers.keys() if accelerometers[acc]]
+
+    return [ACCELEROMETERS.index(acc) for acc in accelerometers]
+
+
+def get_frf(spectrum: dict, plot_type: str = 'Inertance') -> np.ndarray:
+
+    """Select the FRFs of every accelerometer from a spectrum bundle based on the desired plot type."""
+
+    if plot_type == 'Mobility':
+        return spectrum['mobility']
+    elif plot_type == 'Receptance':
+        return spectrum['receptance']
+    else:
+        return spectrum['inertance']
+
+
+def clear_cache():
+
+    """Empty the spectrum cache."""
+
+    _cache.clear()
@@ -1,3 +1,2 @@
 #!/bin/sh
-cron
 python api.py
\ No newline at end of file
@@ -0,0 +1,143 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+
+"""
+This module keeps a binary copy of every recording so that CSV files only need to be parsed once."""
+
+
+# Name of the folder (created next to the CSV files) that holds the binary copies
+CACHE_DIR = os.environ.get('DATA_CACHE_DIR', '.cache')
+
+
+def cache_paths(csv_path: str, variant: str = None):
+
+    """Return the paths of the binary copy (or a named variant of it) and its metadata for a CSV file."""
+
+    folder, filename = os.path.split(csv_path)
+    stem = os.path.splitext(filename)[0]
+    if variant is not None:
+        stem = f'{stem}_{variant}'
+    cache_folder = os.path.join(folder, CACHE_DIR)
+
+    return os.path.join(cache_folder, f'{stem}.npy'), os.path.join(cache_folder, f'{stem}.json')
+
+
+def source_signature(csv_path: str) -> dict:
+
+    """Describe the current state of a CSV file so that stale binary copies can be detected."""
+
+    stat = os.stat(csv_path)
+
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def is_fresh(csv_path: str, variant: str = None) -> bool:
+
+    """Check if the binary copy of a CSV file exists and was built from its current contents."""
+
+    npy_path, meta_path = cache_paths(csv_path, variant)
+
+    if not os.path.isfile(npy_path):
+        return False
+
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+
+    return meta == source_signature(csv_path)
+
+
+def convert(csv_path: str):
+
+    """Parse a CSV file and write its columns to a binary copy."""
+
+    signature = source_signature(csv_path)
+    df = pd.read_csv(csv_path, header=0)
+
+    # Store one row per column so that each channel is contiguous on disk
+    save(csv_path, df.to_numpy(dtype=np.float64).T, signature)
+
+
+def save(csv_path: str, columns: np.ndarray, signature: dict, variant: str = None):
+
+    """Write the columns (one row per column) of a CSV file or of a variant of it to a binary copy."""
+
+    npy_path, meta_path = cache_paths(csv_path, variant)
+    os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+
+    columns = np.ascontiguousarray(columns)
+
+    # Write to temporary files first so that concurrent readers never see a partial copy
+    tmp_suffix = f'.{os.getpid()}.tmp'
+    with open(npy_path + tmp_suffix, 'wb') as f:
+        np.save(f, columns)
+    with open(meta_path + tmp_suffix, 'w') as f:
+        json.dump(signature, f)
+    os.replace(npy_path + tmp_suffix, npy_path)
+    os.replace(meta_path + tmp_suffix, meta_path)
+
+
+def load(csv_path: str) -> np.ndarray:
+
+    """
+    Load the columns of a CSV file from its binary copy, converting it first if necessary.
+
+    Parameters
+    ----------
+    csv_path : str
+        Path to the CSV file.
+
+    Returns
+    -------
+    np.ndarray
+        Read-only memory-mapped array with one row per column of the CSV file.
+    """
+
+    if not is_fresh(csv_path):
+        convert(csv_path)
+
+    npy_path, _ = cache_paths(csv_path)
+
+    return np.load(npy_path, mmap_mode='r')
+
+
+def load_variant(csv_path: str, variant: str, build) -> np.ndarray:
+
+    """
+    Load a derived copy of a CSV file (e.g. resampled data), building it from the full recording if necessary.
+
+    Parameters
+    ----------
+    csv_path : str
+        Path to the CSV file.
+    variant : str
+        Name of the derived copy. It is appended to the name of the binary copy.
+    build : callable
+        Function that takes the columns of the full recording and returns the columns of the derived copy.
+
+    Returns
+    -------
+    np.ndarray
+        Read-only memory-mapped array with one row per column.
+    """
+
+    if not is_fresh(csv_path, variant):
+        signature = source_signature(csv_path)
+        save(csv_path, build(load(csv_path)), signature, variant)
+
+    npy_path, _ = cache_paths(csv_path, variant)
+
+    return np.load(npy_path, mmap_mode='r')
+
+
+if __name__ == "__main__":
+    # Build the binary copies of all recordings ahead of time
+    import glob
+    for csv_path in glob.glob('./data/*.csv') + glob.glob('../../fe/sim_data/*.csv'):
+        if not is_fresh(csv_path):
+            convert(csv_path)
+            print(f'Converted {csv_path}')
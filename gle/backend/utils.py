@@ -1,14 +1,100 @@
 import pandas as pd
 from scipy.integrate import cumulative_trapezoid
+from scipy.signal import butter, sosfiltfilt
+from collections import OrderedDict
+import hashlib
+import json
 import os
+import shutil
+import threading
 import numpy as np
 
 
+# Every in-memory cache, so that they can all be emptied at once (see clear_caches)
+_caches = []
+
+
+class LRU:
+
+    """
+    Least recently used cache of results that are expensive to compute.
+
+    Parameters
+    ----------
+    size : int
+        Maximum total weight of the entries held.
+    weigh : callable, optional
+        Weight of an entry, 1 by default (so size is the maximum number of entries). The most recent entry is kept
+        even if it is heavier than size on its own.
+    """
+
+    def __init__(self, size: int, weigh=None):
+        self.size = size
+        self.weigh = weigh if weigh is not None else (lambda value: 1)
+        self.entries = OrderedDict()
+        self.weight = 0
+        self.lock = threading.Lock()  # Requests may be served from several threads
+        _caches.append(self)
+
+    def get(self, key, build):
+
+        """Return the entry of a key, building it on first use and evicting the least recently used entries."""
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        # Build outside the lock so that other entries can be read in the meantime
+        value = build()
+
+        with self.lock:
+            if key in self.entries:
+                self.weight -= self.weigh(self.entries.pop(key))
+            self.entries[key] = value
+            self.weight += self.weigh(value)
+
+            while self.weight > self.size and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.weight -= self.weigh(evicted)
+
+        return value
+
+    def clear(self):
+
+        """Remove every entry."""
+
+        with self.lock:
+            self.entries.clear()
+            self.weight = 0
+
+
+def clear_caches():
+
+    """Empty every in-memory cache (e.g. after a recording has changed)."""
+
+    for cache in _caches:
+        cache.clear()
+
+
+def resolve_excitation(options: dict):
+
+    """Return the excitation type whose data is used for the requested excitation."""
+
+    # Make sure that free vibration reads hammer testing data
+    if options['excitationType'] == 'Free vibration':
+        return 'Soft'
+    elif options['excitationType'] == 'Hammer testing':
+        return options['tipHardness']
+
+    return options['excitationType']
+
+
 def format_filename(options: dict, mirror_shaker_position: bool = False):
 
     """Format filename to standard schema."""
 
-    excitation = options['excitationType'].split(' ')[0].upper()
+    excitation = resolve_excitation(options).split(' ')[0].upper()
 
     if mirror_shaker_position:
         return f"{excitation}_{4-options['shakerPosition']}"
@@ -16,70 +102,306 @@ def format_filename(options: dict, mirror_shaker_position: bool = False):
         return f"{excitation}_{options['shakerPosition']}"
 
 
-def check_if_file_exists(options: dict, plot_type: str):
+# Options (besides the dataset) that change the output of each plot type
+PLOT_OPTIONS = {
+    'accel': ['samplingFreq', 'accelerometers'],
+    'force': ['samplingFreq'],
+    'anim': ['samplingFreq', 'integration'],
+    'dft': ['samplingFreq', 'accelerometers'],
+    'bode': ['samplingFreq', 'accelerometers', 'lowerCutoff', 'upperCutoff', 'estimator'],
+    'nyquist': ['samplingFreq', 'firstAccelerometer', 'lowerCutoff', 'upperCutoff', 'estimator'],
+    'mode-shapes': ['samplingFreq', 'accelerometers', 'lowerCutoff', 'upperCutoff', 'estimator'],
+    'argand': ['samplingFreq', 'accelerometers'],
+    'modal': ['samplingFreq', 'accelerometers', 'lowerCutoff', 'upperCutoff', 'estimator'],
+}
 
-    """Check if file exists before generating a new one."""
+# Filter types that are applied to the data (any other value leaves the data unfiltered)
+FILTER_OPTIONS = {
+    'bandPass': ['lowerCutoff', 'upperCutoff'],
+    'lowPass': ['upperCutoff'],
+    'highPass': ['lowerCutoff'],
+}
 
-    if plot_type in ['accel', 'dft', 'anim', 'nyquist', 'bode']:
-        filename = format_accel_plot_name(options, plot_type)
-    else:
-        filename = format_filename(options) + '_'  + plot_type + '.png'
 
-    return os.path.isfile(f"./images/{filename}")
+# Ways of integrating acceleration to displacement (the first is the default)
+INTEGRATION_METHODS = ['time', 'frequency', 'highPass']
 
+# Frequency (Hz) below which drift is removed by the 'frequency' and 'highPass' integration methods
+DRIFT_CUTOFF = float(os.environ.get('DRIFT_CUTOFF', 5))
 
-def format_accel_plot_name(options: dict, plot_type: str):
+# Maximum number of integrated datasets held in memory
+DISPLACEMENT_CACHE_SIZE = int(os.environ.get('DISPLACEMENT_CACHE_SIZE', 16))
+
+_displacement_cache = LRU(DISPLACEMENT_CACHE_SIZE)
+
+
+# FRF estimators (the first is the default): the ratio of the spectra of the whole record, or H1/H2 averaged over segments
+ESTIMATORS = ['single', 'H1', 'H2']
+
+# Default number of samples in each segment and the fraction of each segment shared with the next one
+SEGMENT_LENGTH = int(os.environ.get('SEGMENT_LENGTH', 2048))
+SEGMENT_OVERLAP = float(os.environ.get('SEGMENT_OVERLAP', 0.5))
+
+# Default number of frequencies evaluated within the requested band when zooming
+ZOOM_POINTS = int(os.environ.get('ZOOM_POINTS', 1024))
 
-    """Format filename to standard schema."""
 
-    accelerometers = options['accelerometers']
-    file_suffix = ''
-    for index, acc in enumerate(accelerometers.keys()):
-        if accelerometers[acc]:
-            file_suffix += f'_{index}'
+# Image formats that plots can be saved in (the first is the default)
+IMAGE_FORMATS = ['png', 'webp', 'svg']
 
-    if plot_type in ['bode', 'nyquist', 'mode-shapes']:
-        filename = format_filename(options) + '_' + str(options['samplingFreq']) + '_' + plot_type + file_suffix + '_f' + str(options['lowerCutoff']) + '-' + str(options['upperCutoff']) + '.png'
+# Resolution tiers (e.g. thumbnails for the dashboard) and their dots per inch
+RESOLUTIONS = {
+    'thumbnail': 60,
+    'preview': 120,
+    'full': 300,
+}
+
+
+# Animation formats (the first is the default), used only if an encoder for them is installed
+ANIMATION_FORMATS = ['gif', 'webp', 'mp4']
+
+
+_animation_formats = None
+
+
+def animation_formats() -> list:
+
+    """Return the animation formats that can be encoded on this machine."""
+
+    global _animation_formats
+
+    if _animation_formats is None:
+        from PIL import features
+
+        _animation_formats = ['gif']
+        if features.check('webp'):
+            _animation_formats.append('webp')
+        if shutil.which('ffmpeg'):
+            _animation_formats.append('mp4')
+
+    return _animation_formats
+
+
+def output_settings(options: dict, plot_type: str = None) -> dict:
+
+    """Return the file format, resolution tier and dpi requested for a plot (full resolution PNG by default)."""
+
+    if plot_type == 'anim':
+        image_format = options['format'] if options.get('format') in animation_formats() else ANIMATION_FORMATS[0]
+    elif options.get('format') in IMAGE_FORMATS:
+        image_format = options['format']
     else:
-        filename = format_filename(options) + '_' + str(options['samplingFreq']) + '_' + plot_type + file_suffix + '.png'
+        image_format = IMAGE_FORMATS[0]
 
-    return filename
+    resolution = options.get('resolution') if options.get('resolution') in RESOLUTIONS else 'full'
+    if image_format == 'svg':
+        resolution = 'full'  # Vector images look the same at any resolution
 
+    return {'format': image_format, 'resolution': resolution, 'dpi': RESOLUTIONS[resolution]}
 
-def accel_to_disp(data: pd.DataFrame, options: dict):
 
-    """Convert acceleration to displacement by numerical integration."""
+def integration_settings(options: dict) -> dict:
+
+    """Return the integration method and drift cutoff requested for displacements (plain time integration by default)."""
+
+    method = options['integration'] if options.get('integration') in INTEGRATION_METHODS else INTEGRATION_METHODS[0]
+    cutoff = None
+    if method != 'time':
+        try:
+            cutoff = float(options.get('driftCutoff', DRIFT_CUTOFF))
+        except (TypeError, ValueError):
+            cutoff = DRIFT_CUTOFF
+        if not np.isfinite(cutoff):
+            cutoff = DRIFT_CUTOFF
+
+    return {'method': method, 'driftCutoff': cutoff}
+
+
+def estimator_settings(options: dict) -> dict:
+
+    """Return the FRF estimator, its segments and the zoomed band requested (every bin of the whole record by default)."""
+
+    settings = {
+        'estimator': options['estimator'] if options.get('estimator') in ESTIMATORS else ESTIMATORS[0],
+        'segmentLength': None,
+        'overlap': None,
+        'band': None,
+        'bandPoints': None,
+    }
+
+    if settings['estimator'] != 'single':
+        settings['segmentLength'] = max(int(options.get('segmentLength', SEGMENT_LENGTH)), 16)
+        settings['overlap'] = min(max(float(options.get('overlap', SEGMENT_OVERLAP)), 0), 0.95)
+
+    # An inverted or zero-width band has no grid to zoom into, so every bin of the whole record is used instead
+    if options.get('zoom') and float(options['lowerCutoff']) < float(options['upperCutoff']):
+        settings['band'] = (float(options['lowerCutoff']), float(options['upperCutoff']))
+        settings['bandPoints'] = max(int(options.get('zoomPoints', ZOOM_POINTS)), 2)
+
+    return settings
+
+
+def canonical_options(options: dict, plot_type: str) -> dict:
+
+    """Reduce the request options to the normalised values that affect a plot."""
+
+    active = [acc for acc in options['accelerometers'].keys() if options['accelerometers'][acc]]
+
+    normalised = {
+        'dataset': format_filename(options),
+        'samplingFreq': float(options['samplingFreq']),
+        'accelerometers': sorted(active),
+        'firstAccelerometer': active[:1],  # The Nyquist plot only uses the first accelerometer
+        'lowerCutoff': float(options['lowerCutoff']),
+        'upperCutoff': float(options['upperCutoff']),
+        'integration': integration_settings(options),
+        'estimator': estimator_settings(options),
+    }
+
+    settings = output_settings(options, plot_type)
+    canonical = {
+        'plotType': plot_type,
+        'dataset': normalised['dataset'],
+        'format': settings['format'],
+        'resolution': settings['resolution'],
+    }
+    for key in PLOT_OPTIONS.get(plot_type, ['samplingFreq', 'accelerometers', 'lowerCutoff', 'upperCutoff']):
+        canonical[key] = normalised[key]
+
+    filter_type = options.get('filterType')
+    if filter_type in FILTER_OPTIONS:
+        canonical['filterType'] = filter_type
+        for key in FILTER_OPTIONS[filter_type]:
+            canonical[key] = normalised[key]
+
+    return canonical
+
+
+def format_plot_name(options: dict, plot_type: str):
+
+    """Format the filename of a plot from a hash of every option that affects it."""
+
+    canonical = canonical_options(options, plot_type)
+    digest = hashlib.sha1(json.dumps(canonical, sort_keys=True).encode()).hexdigest()[:16]
+
+    return f"{canonical['dataset']}_{plot_type}_{digest}.{canonical['format']}"
+
+
+def integrate(a: np.ndarray, t: np.ndarray, method: str = 'time', cutoff: float = DRIFT_CUTOFF) -> tuple:
+
+    """
+    Integrate acceleration twice along axis 0, for every channel at once.
+
+    Parameters
+    ----------
+    a : np.ndarray
+        Acceleration with one column per channel.
+    t : np.ndarray
+        Time of each row (assumed to be evenly spaced).
+    method : str, optional
+        'time' integrates with the trapezoidal rule, 'frequency' divides the spectrum by jω (and (jω)^2) and
+        'highPass' integrates with the trapezoidal rule and removes drift with a zero-phase high-pass filter.
+    cutoff : float, optional
+        Frequency (Hz) below which drift is removed, clamped to lie strictly between 0 Hz and the Nyquist frequency.
+        Not used by 'time'.
+
+    Returns
+    -------
+    tuple
+        The velocity and displacement, each with the same shape as a.
+    """
+
+    # Normalise accelerations to have zero mean (i.e. zero steady state)
+    a = a - np.mean(a, axis=0)
+
+    sample_rate = (len(t) - 1) / (t[-1] - t[0])
+
+    # Neither method can remove drift at or below 0 Hz, nor can the filter be designed at or above the Nyquist frequency
+    nyquist = sample_rate / 2
+    cutoff = min(max(cutoff, 1e-3 * nyquist), 0.99 * nyquist) if cutoff is not None else None
 
-    # Time intervals (assuming uniform spacing)
-    t = data["t"].values
+    if method == 'frequency':
+        n = len(t)
+        omega = 2 * np.pi * np.fft.rfftfreq(n, 1/sample_rate)
+        spectrum = np.fft.rfft(a, axis=0)
 
-    # Set dict to transfer to disp df
-    disp_dict = {"t": t}  # Last two values must be removed due to double integration
-    vel_dict = {"t": t}
+        # Bins below the cutoff (including 0 Hz) would be amplified without bound, so they are dropped
+        keep = omega >= 2 * np.pi * cutoff
+        gain = np.zeros(len(omega), dtype=complex)
+        gain[keep] = 1 / (1j * omega[keep])
 
-    # Perform double integration for each acceleration column
-    for col in ["A0", "A1", "A2", "A3", "A4"]:
-        a = data[col].values/9.81  # Acceleration data (convert from g to m/s^2)
+        v = np.fft.irfft(spectrum * gain[:, None], n, axis=0)
+        s = np.fft.irfft(spectrum * (gain**2)[:, None], n, axis=0)
 
-        # Normalise accelerations to have zero mean (i.e. zero steady state)
-        a -= np.mean(a)
-        
-        # First integration: acceleration to velocity (assuming initial velocity = 0)
-        v = cumulative_trapezoid(a, t, initial=0)
-        
-        # Second integration: velocity to displacement (assuming initial displacement = 0)
-        s = cumulative_trapezoid(v, t, initial=0)
-        
-        # Store displacement
-        disp_dict[col] = s
-        vel_dict[col] = v
+        return v, s
 
-    displacement_df = pd.DataFrame(data=disp_dict)
-    velocity_df = pd.DataFrame(data=velocity_df)
+    if method == 'highPass':
+        sos = butter(4, cutoff, btype='high', fs=sample_rate, output='sos')
+        a = sosfiltfilt(sos, a, axis=0)
+
+    # First integration: acceleration to velocity (assuming initial velocity = 0)
+    v = cumulative_trapezoid(a, t, axis=0, initial=0)
+    if method == 'highPass':
+        v = sosfiltfilt(sos, v, axis=0)
+
+    # Second integration: velocity to displacement (assuming initial displacement = 0)
+    s = cumulative_trapezoid(v, t, axis=0, initial=0)
+    if method == 'highPass':
+        s = sosfiltfilt(sos, s, axis=0)
+
+    return v, s
+
+
+def integrate_columns(data: pd.DataFrame, settings: dict) -> tuple:
+
+    """Integrate the acceleration of every accelerometer with the given integration settings (see accel_to_disp)."""
+
+    columns = ["A0", "A1", "A2", "A3", "A4"]
+    t = data["t"].to_numpy(dtype=float)
+    a = data[columns].to_numpy(dtype=float)/9.81  # Acceleration data (convert from g to m/s^2)
+
+    v, s = integrate(a, t, settings['method'], settings['driftCutoff'])
+
+    displacement_df = pd.DataFrame(s, columns=columns)
+    displacement_df.insert(0, "t", t)
+    velocity_df = pd.DataFrame(v, columns=columns)
+    velocity_df.insert(0, "t", t)
 
     return displacement_df, velocity_df
 
 
+def accel_to_disp(data: pd.DataFrame, options: dict):
+
+    """
+    Convert acceleration to displacement by numerical integration.
+
+    The result is cached per dataset and integration setting, so the animation and the displacement series share
+    it. The returned DataFrames must not be modified.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing the acceleration data and corresponding time data.
+    options : dict
+        Dictionary containing the following keys:
+            - 'integration': Optional. One of INTEGRATION_METHODS (see integrate), 'time' by default.
+            - 'driftCutoff': Optional. Frequency (Hz) below which drift is removed (defaults to DRIFT_CUTOFF).
+
+    Returns
+    -------
+    tuple
+        DataFrames of the displacement and the velocity, each with the time 't' and one column per accelerometer.
+    """
+
+    settings = integration_settings(options)
+
+    # Keyed on the version of the recording as well (see reader.read_csv), so a replaced recording is integrated again
+    key = (format_filename(options), data.attrs.get('signature'), float(options['samplingFreq']), len(data),
+           settings['method'], settings['driftCutoff'])
+
+    return _displacement_cache.get(key, lambda: integrate_columns(data, settings))
+
+
 def circfit(x,y):
 
     """
@@ -94,39 +416,140 @@ def circfit(x,y):
     - rmse: Root Mean Squared Error (optional)
     """ 
 
-    # Prepare variables for solving the linear system
+    r, xc, yc, rmse = circfit_batch(np.asarray(x)[None], np.asarray(y)[None])
+
+    # Return the fitted circle parameters
+    return r[0], xc[0], yc[0], rmse[0]
+
+
+def circfit_batch(x: np.ndarray, y: np.ndarray, mask: np.ndarray = None) -> tuple:
+
+    """
+    Least squares fit of several sets of X-Y data to circles at once.
+
+    The normal equations of every set are stacked into one (k, 3, 3) system and solved in a single call.
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        2-D arrays with one set of points per row.
+    mask : np.ndarray, optional
+        Boolean array of the same shape marking the points that belong to each set, so that sets of different
+        lengths can be padded to the same width. Every point is used by default.
+
+    Returns
+    -------
+    tuple
+        Arrays of the radius, the X and Y coordinates of the centre and the RMSE of each fit (NaN where a set has
+        fewer than three points).
+    """
+
+    w = np.ones(x.shape) if mask is None else mask.astype(float)
+    x = np.where(w > 0, x, 0)
+    y = np.where(w > 0, y, 0)
+
+    # Prepare variables for solving the linear systems
     xx = x ** 2
     yy = y ** 2
     xy = x * y
     xxyy = xx + yy
-    sx = np.sum(x)
-    sy = np.sum(y)
-    sxx = np.sum(xx)
-    syy = np.sum(yy)
-    sxy = np.sum(xy)
-
-    # Solve the linear system using LU decomposition
-    A = np.array([[sx, sy, len(x)], [sxy, syy, sy], [sxx, sxy, sx]])
-    B = np.array([sxx + syy, np.sum(xxyy * y), np.sum(xxyy * x)])
-
-    # # LU decomposition
-    # L, U = np.linalg.lu(A)
-    # a = np.linalg.solve(U, np.linalg.solve(L, b))
-    a = np.linalg.solve(A, B)
-
-    # Compute the circle parameters
-    xc = 0.5 * a[0]  # X-position of the center of the fitted circle
-    yc = 0.5 * a[1]  # Y-position of the center of the fitted circle
-    r = np.sqrt(xc**2 + yc**2 + a[2])  # Radius of the fitted circle
-    # Calculate RMSE if needed
-    rmse = np.sqrt(np.mean((np.sqrt((x - xc) ** 2 + (y - yc) ** 2) - r) ** 2))
+    n = np.sum(w, axis=1)
+    sx = np.sum(x * w, axis=1)
+    sy = np.sum(y * w, axis=1)
+    sxx = np.sum(xx * w, axis=1)
+    syy = np.sum(yy * w, axis=1)
+    sxy = np.sum(xy * w, axis=1)
+
+    A = np.stack([
+        np.stack([sx, sy, n], axis=-1),
+        np.stack([sxy, syy, sy], axis=-1),
+        np.stack([sxx, sxy, sx], axis=-1),
+    ], axis=1)
+    B = np.stack([sxx + syy, np.sum(xxyy * y * w, axis=1), np.sum(xxyy * x * w, axis=1)], axis=-1)
+
+    # A circle needs at least three points, the other systems are replaced so that they can still be solved
+    valid = n >= 3
+    A[~valid] = np.eye(3)
+
+    try:
+        a = np.linalg.solve(A, B[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        a = (np.linalg.pinv(A) @ B[..., None])[..., 0]  # Collinear points
+
+    # Compute the circle parameters of the valid sets only (the solutions of the replaced systems are meaningless)
+    xc, yc, r, rmse = (np.full(len(n), np.nan) for _ in range(4))
+    a = a[valid]
+    xc[valid] = 0.5 * a[:, 0]  # X-position of the center of the fitted circle
+    yc[valid] = 0.5 * a[:, 1]  # Y-position of the center of the fitted circle
+    r[valid] = np.sqrt(xc[valid]**2 + yc[valid]**2 + a[:, 2])  # Radius of the fitted circle
+    residuals = np.sqrt((x[valid] - xc[valid, None]) ** 2 + (y[valid] - yc[valid, None]) ** 2) - r[valid, None]
+    rmse[valid] = np.sqrt(np.sum(residuals ** 2 * w[valid], axis=1) / n[valid])
 
-    # Return the fitted circle parameters
     return r, xc, yc, rmse
 
 
 def closest_index(point, arr):
-    return min(range(len(arr)), key=lambda i: abs(arr[i] - point))
+
+    """Return the index of the value of an array (sorted or not) closest to a point (the first one if tied)."""
+
+    return int(np.argmin(np.abs(np.asarray(arr) - point)))
+
+
+def band(f: np.ndarray, f_min: float = -np.inf, f_max: float = np.inf) -> slice:
+
+    """Return the slice of a sorted frequency axis from f_min to f_max (both included), found by binary search."""
+
+    return slice(int(np.searchsorted(f, f_min, side='left')), int(np.searchsorted(f, f_max, side='right')))
+
+
+def frequency_at(f: np.ndarray, index: float) -> float:
+
+    """Return the frequency at a fractional index of a frequency axis by linear interpolation."""
+
+    return float(np.interp(index, np.arange(len(f)), f))
+
+
+def half_power_points(gain: np.ndarray, peak: int, lo: int = 0, hi: int = None) -> tuple:
+
+    """
+    Find where a gain curve first drops to the half-power (-3 dB) level on either side of a peak, to a fraction of a bin.
+
+    Parameters
+    ----------
+    gain : np.ndarray
+        Gain in dB.
+    peak : int
+        Index of the peak.
+    lo, hi : int, optional
+        Range of indices searched (the whole curve by default).
+
+    Returns
+    -------
+    tuple
+        The fractional indices of the left and right half-power points, linearly interpolated between the bins either
+        side of the crossing (None where the gain does not drop far enough within the range).
+    """
+
+    if hi is None:
+        hi = len(gain) - 1
+
+    level = gain[peak] - 3
+
+    # Walk away from the peak and stop at the first bin at or below the half-power level
+    below_left = gain[peak:lo - 1 if lo > 0 else None:-1] <= level
+    below_right = gain[peak:hi + 1] <= level
+
+    left = right = None
+
+    if below_left.any():
+        i = peak - int(np.argmax(below_left))
+        left = i + (level - gain[i]) / (gain[i + 1] - gain[i])
+
+    if below_right.any():
+        i = peak + int(np.argmax(below_right))
+        right = i - (level - gain[i]) / (gain[i - 1] - gain[i])
+
+    return left, right
 
 
 if __name__ == '__main__':
@@ -0,0 +1,160 @@
+import asyncio
+import glob
+import time
+import os
+import re
+import plotter as p
+import animate as a
+import render as rd
+import store
+import utils as u
+
+"""
+This module renders the most common plots ahead of time, at startup and whenever a recording in the data folder
+is added or changed, so that the first request in a lab session does not wait for a render."""
+
+
+DATA_DIR = './data'
+
+# Sampling frequencies to prepare plots for
+SAMPLING_FREQS = [int(freq) for freq in os.environ.get('WARMUP_SAMPLING_FREQS', '2048,1024,512').split(',')]
+
+# Seconds between checks of the data folder for new or changed recordings
+POLL_INTERVAL = float(os.environ.get('WARMUP_POLL_INTERVAL', 30))
+
+# Accelerometer selections to prepare plots for (each accelerometer on its own and all of them together)
+ACCELEROMETER_SUBSETS = [[acc] for acc in ['A0', 'A1', 'A2', 'A3', 'A4']] + [['A0', 'A1', 'A2', 'A3', 'A4']]
+
+# Plots that do not depend on user-chosen cutoff frequencies
+PLOTS = {
+    'accel': p.plot_acceleration,
+    'force': p.plot_forcing,
+    'dft': p.plot_dft,
+    'anim': a.animate_beam,
+}
+
+progress = {
+    'running': False,
+    'total': 0,
+    'done': 0,
+    'failed': 0,
+    'startTime': None,
+    'endTime': None,
+}
+
+
+def is_recording(csv_path: str) -> bool:
+
+    """Check if a CSV file is a recording (e.g. HARD_0.csv) rather than a derived file such as filtered data."""
+
+    return re.fullmatch(r'[A-Z]+(_[A-Z]+)*_[0-4]', os.path.splitext(os.path.basename(csv_path))[0]) is not None
+
+
+def dataset_options(csv_path: str) -> list:
+
+    """Build the options of every shaker position that is served by a recording."""
+
+    excitation, position = os.path.splitext(os.path.basename(csv_path))[0].rsplit('_', 1)
+    position = int(position)
+
+    # Recordings at 0 and l/4 are mirrored to serve l and 3l/4
+    positions = [position] if position == 2 else [position, 4 - position]
+
+    return [{
+        'excitationType': excitation.capitalize(),
+        'tipHardness': excitation.capitalize(),
+        'shakerPosition': shaker_position,
+        'filterType': 'none',
+        'lowerCutoff': 0,
+        'upperCutoff': 0,
+    } for shaker_position in positions]
+
+
+def build_jobs(csv_paths: list) -> list:
+
+    """List the distinct plots (options, plot type and plotting function) to render for the given recordings."""
+
+    jobs = {}
+
+    for csv_path in csv_paths:
+        for base in dataset_options(csv_path):
+            for sampling_freq in SAMPLING_FREQS:
+                for subset in ACCELEROMETER_SUBSETS:
+                    options = {
+                        **base,
+                        'samplingFreq': sampling_freq,
+                        'accelerometers': {acc: acc in subset for acc in ['A0', 'A1', 'A2', 'A3', 'A4']},
+                    }
+                    for plot_type, func in PLOTS.items():
+                        # Plots that ignore some options share a filename, so they are only rendered once
+                        jobs.setdefault(u.format_plot_name(options, plot_type), (options, plot_type, func))
+
+    return list(jobs.values())
+
+
+async def run(serve, csv_paths: list, concurrency: int):
+
+    """
+    Render the common plots of the given recordings.
+
+    Parameters
+    ----------
+    serve : callable
+        Coroutine that returns the path to a plot, rendering it if it is not cached (api.serve_plot).
+    csv_paths : list
+        Paths of the recordings to prepare plots for.
+    concurrency : int
+        Maximum number of plots rendered at once. Keeping this at the number of render workers leaves room for
+        requests from users in between.
+    """
+
+    jobs = build_jobs(csv_paths)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    progress.update({'running': True, 'total': len(jobs), 'done': 0, 'failed': 0, 'startTime': time.time(), 'endTime': None})
+    print(f'Warm-up: rendering {len(jobs)} plots for {len(csv_paths)} recordings')
+
+    async def render(options, plot_type, func):
+        async with semaphore:
+            try:
+                await serve(options, plot_type, func)
+            except Exception as e:
+                progress['failed'] += 1
+                print(f'Warm-up: failed to render {u.format_plot_name(options, plot_type)} ({e!r})')
+            else:
+                progress['done'] += 1
+
+            if (progress['done'] + progress['failed']) % 50 == 0:
+                print(f"Warm-up: {progress['done'] + progress['failed']}/{progress['total']} plots")
+
+    await asyncio.gather(*(render(*job) for job in jobs))
+
+    progress.update({'running': False, 'endTime': time.time()})
+    print(f"Warm-up: finished {progress['done']} plots ({progress['failed']} failed) in {progress['endTime'] - progress['startTime']:.1f} s")
+
+
+async def watch(serve, invalidate, concurrency: int):
+
+    """Warm up every recording at startup, then again for any recording that is added or changed."""
+
+    signatures = {}
+
+    while True:
+        csv_paths = [csv_path for csv_path in glob.glob(os.path.join(DATA_DIR, '*.csv')) if is_recording(csv_path)]
+        current = {csv_path: store.source_signature(csv_path) for csv_path in csv_paths}
+        changed = [csv_path for csv_path, signature in current.items() if signatures.get(csv_path) != signature]
+
+        if changed:
+            # Plots and results computed from the old version of a recording are no longer valid, in this process
+            # or in the render workers
+            if signatures:
+                for csv_path in changed:
+                    for options in dataset_options(csv_path):
+                        invalidate(u.format_filename(options))
+                u.clear_caches()
+                rd.recycle()
+
+            await run(serve, changed, concurrency)
+
+        signatures = current
+        await asyncio.sleep(POLL_INTERVAL)